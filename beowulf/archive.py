@@ -0,0 +1,377 @@
+# coding=utf-8
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from functools import partial
+from itertools import tee
+
+from appdirs import user_data_dir
+
+from beowulfbase.json_codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+#: kinds of records, each with its own index
+BLOCK, OPS = 0, 1
+
+_index_names = {BLOCK: 'blocks.idx', OPS: 'ops.idx'}
+
+# record header: block_num, kind, length of the compressed payload
+_header = struct.Struct('<IBI')
+
+# index entry: ((segment + 1) << 40) | offset, 0 if absent
+_entry = struct.Struct('<Q')
+_offset_bits = 40
+_offset_mask = (1 << _offset_bits) - 1
+
+_segment_re = re.compile(r'^segment-(\d{8})\.dat$')
+
+
+def _pread(fd, size, offset, lock):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+class _Index(object):
+    """ Sparse array of index entries, one per block number, read through
+    a memory map which is extended when the file grows. """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        flags = os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT
+        self._fd = os.open(path, flags | getattr(os, 'O_BINARY', 0))
+        self._lock = threading.Lock()
+        self._map = None
+        self._mapped = 0
+
+    def _remap(self):
+        with self._lock:
+            size = os.fstat(self._fd).st_size
+            if size > self._mapped:
+                # readers holding the old map keep it alive until done
+                self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+                self._mapped = size
+
+    def get(self, block_num):
+        position = block_num * _entry.size
+        if position + _entry.size > self._mapped:
+            self._remap()
+            if position + _entry.size > self._mapped:
+                return 0
+        return _entry.unpack_from(self._map, position)[0]
+
+    def set(self, block_num, value):
+        with self._lock:
+            os.lseek(self._fd, block_num * _entry.size, os.SEEK_SET)
+            os.write(self._fd, _entry.pack(value))
+
+    def sync(self):
+        os.fsync(self._fd)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+                self._mapped = 0
+            os.close(self._fd)
+
+
+class BlockArchive(object):
+    """ Append-only archive of irreversible blocks and their operations.
+
+    Records are compressed with zlib and appended to segment files of
+    about ``segment_size`` bytes. Each kind of record (blocks, operations)
+    has an index file with a fixed-size entry per block number, read
+    through a memory map, so that any block is found with one lookup and
+    one read whatever the size of the archive.
+
+    Only one process may write to an archive at a time; any number may
+    open it with ``readonly=True`` and read it, including while it is
+    being written.
+
+    The archive is filled by passing it to :class:`beowulf.beowulfd.Beowulfd`
+    (irreversible blocks are stored as they are fetched, by
+    ``Blockchain.stream_from`` or ``history`` for instance) or in bulk
+    with :func:`backfill`. ``Beowulfd.get_block``, ``get_ops_in_block``
+    and the streams then read from it before asking the node.
+
+    Args:
+        path (str): Directory of the archive, created if needed. Defaults
+            to ``archive`` in the beowulf user data directory.
+        segment_size (int): Size in bytes after which a new segment file
+            is started.
+        compress_level (int): zlib compression level of new records.
+        json_codec (str, JsonCodec): Codec of the records, see
+            ``beowulfbase.json_codec.get_codec``.
+        chain_id (str): Chain of the blocks. If given, it is recorded in
+            a new archive and checked against an existing one.
+        readonly (bool): Open an existing archive for reading only.
+
+    .. code-block:: python
+
+       from beowulf.archive import BlockArchive
+       from beowulf.beowulfd import Beowulfd
+
+       beowulfd = Beowulfd(archive=BlockArchive('/data/bwf-archive'))
+
+    """
+
+    def __init__(self, path=None, segment_size=256 * 2 ** 20,
+                 compress_level=6, json_codec=None, chain_id=None,
+                 readonly=False):
+        if path is None:
+            path = os.path.join(user_data_dir("BWF", "BeowulfTeam"),
+                                'archive')
+        if not readonly and not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.readonly = readonly
+        self.segment_size = segment_size
+        self.compress_level = compress_level
+        self.codec = get_codec(json_codec)
+        self.bind_chain(chain_id)
+        self._lock = threading.Lock()
+        self._indexes = {kind: _Index(os.path.join(path, name), readonly)
+                         for kind, name in _index_names.items()}
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+        segments = sorted(int(m.group(1)) for m in
+                          map(_segment_re.match, os.listdir(path)) if m)
+        self._segment = segments[-1] if segments else 0
+        self._writer = None
+        self._size = 0
+        if not readonly:
+            self._open_writer()
+
+    def bind_chain(self, chain_id):
+        """ Record that the archive holds blocks of chain ``chain_id``, or
+        raise ``ValueError`` if it holds blocks of another chain. """
+        meta_path = os.path.join(self.path, 'meta.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (IOError, OSError):
+            meta = {}
+        self.chain_id = meta.get('chain_id')
+        if chain_id is None or chain_id == self.chain_id:
+            return
+        if self.chain_id is not None:
+            raise ValueError('Archive %s holds blocks of chain %s, not %s' %
+                             (self.path, self.chain_id, chain_id))
+        self.chain_id = chain_id
+        if not self.readonly:
+            meta['chain_id'] = chain_id
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, 'segment-%08d.dat' % segment)
+
+    def _open_writer(self):
+        # called with self._lock held, or from __init__
+        self._writer = os.open(self._segment_path(self._segment),
+                               os.O_WRONLY | os.O_CREAT | os.O_APPEND |
+                               getattr(os, 'O_BINARY', 0))
+        self._size = self._recover(self._segment)
+
+    def _recover(self, segment):
+        """ Return the length of the complete records at the start of
+        ``segment``, truncating the file there: a crash while appending
+        may leave a partial record at its end. """
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        end = 0
+        with open(path, 'rb') as f:
+            while end + _header.size <= size:
+                f.seek(end)
+                header = f.read(_header.size)
+                end_of_record = end + _header.size + \
+                    _header.unpack(header)[2]
+                if end_of_record > size:
+                    break
+                end = end_of_record
+        if end < size:
+            logger.warning('Truncating %s from %d to %d bytes', path, size,
+                           end)
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        return end
+
+    def _reader(self, segment):
+        fd = self._readers.get(segment)
+        if fd is None:
+            with self._readers_lock:
+                fd = self._readers.get(segment)
+                if fd is None:
+                    fd = os.open(self._segment_path(segment),
+                                 os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                    self._readers[segment] = fd
+        return fd
+
+    def _locate(self, kind, block_num):
+        """ Return the segment reader, offset and length of the payload of
+        a record, or ``None`` if the index has no entry for it or its entry
+        is stale. """
+        value = self._indexes[kind].get(block_num)
+        if not value:
+            return None
+        segment = (value >> _offset_bits) - 1
+        offset = value & _offset_mask
+        fd = self._reader(segment)
+        header = _pread(fd, _header.size, offset, self._readers_lock)
+        if len(header) < _header.size:
+            return None
+        num, record_kind, length = _header.unpack(header)
+        if (num, record_kind) != (block_num, kind):
+            # the index was written but not the record, see _recover
+            return None
+        return fd, offset + _header.size, length
+
+    def _get(self, kind, block_num):
+        location = self._locate(kind, block_num)
+        if location is None:
+            return None
+        fd, offset, length = location
+        payload = _pread(fd, length, offset, self._readers_lock)
+        return self.codec.loads(zlib.decompress(payload))
+
+    def _put(self, kind, block_num, value):
+        if self.readonly:
+            raise IOError('Archive %s is read-only' % self.path)
+        index = self._indexes[kind]
+        with self._lock:
+            # a stale entry is overwritten
+            if self._locate(kind, block_num) is not None:
+                return False
+            payload = zlib.compress(self.codec.dumps(value),
+                                    self.compress_level)
+            if self._size and \
+                    self._size + _header.size + len(payload) > \
+                    self.segment_size:
+                os.close(self._writer)
+                self._segment += 1
+                self._open_writer()
+            offset = self._size
+            os.write(self._writer,
+                     _header.pack(block_num, kind, len(payload)) + payload)
+            self._size += _header.size + len(payload)
+            index.set(block_num,
+                      ((self._segment + 1) << _offset_bits) | offset)
+        return True
+
+    def get_block(self, block_num):
+        """ Return the block ``block_num``, or ``None`` if it is not in the
+        archive. """
+        return self._get(BLOCK, block_num)
+
+    def get_ops(self, block_num, virtual_only=False):
+        """ Return the operations of block ``block_num``, as returned by
+        ``get_ops_in_block``, or ``None`` if they are not in the archive.
+        """
+        ops = self._get(OPS, block_num)
+        if ops is not None and virtual_only:
+            ops = [op for op in ops if op.get('virtual_op')]
+        return ops
+
+    def has_block(self, block_num):
+        return self._locate(BLOCK, block_num) is not None
+
+    def has_ops(self, block_num):
+        return self._locate(OPS, block_num) is not None
+
+    def put_block(self, block_num, block):
+        """ Add block ``block_num``. The block must be irreversible.
+
+        Returns:
+            bool: ``False`` if the block was already in the archive.
+        """
+        return self._put(BLOCK, block_num, block)
+
+    def put_ops(self, block_num, ops):
+        """ Add all the operations of block ``block_num``, virtual or not,
+        as returned by ``get_ops_in_block(block_num, False)``. The block
+        must be irreversible.
+
+        Returns:
+            bool: ``False`` if they were already in the archive.
+        """
+        return self._put(OPS, block_num, ops)
+
+    def sync(self):
+        """ Flush the archive to disk. Records added before a crash may
+        otherwise be lost, but never corrupt the archive. """
+        if self.readonly:
+            return
+        with self._lock:
+            os.fsync(self._writer)
+            for index in self._indexes.values():
+                index.sync()
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            if self._writer is not None:
+                os.close(self._writer)
+            for index in self._indexes.values():
+                index.close()
+        with self._readers_lock:
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers.clear()
+
+
+def backfill(beowulfd, archive, start_block, end_block=None,
+             max_in_flight=None):
+    """ Add blocks ``start_block`` to ``end_block`` (included) and their
+    operations to ``archive``, fetching those it misses concurrently.
+
+    Args:
+        beowulfd (Beowulfd): Client to fetch the blocks with.
+        archive (BlockArchive): The archive.
+        start_block (int): First block.
+        end_block (int): Last block. Defaults to, and is capped at, the
+            last irreversible block.
+        max_in_flight (int): Number of concurrent requests, see
+            ``Beowulfd.stream_blocks``.
+
+    Returns:
+        int: Number of records added by this call, directly or through
+        ``beowulfd`` if it uses ``archive``.
+    """
+    props = beowulfd.get_dynamic_global_properties(max_age=0)
+    last_irreversible = props['last_irreversible_block_num']
+    if end_block is None or end_block > last_irreversible:
+        end_block = last_irreversible
+
+    fetchers = [
+        (archive.has_block, archive.put_block,
+         partial(beowulfd.stream_blocks, add_block_num=False)),
+        (archive.has_ops, archive.put_ops, beowulfd.stream_ops_in_blocks),
+    ]
+    # a Beowulfd using this archive adds what it fetches itself, so
+    # put() finds those records already there
+    client_archives = getattr(beowulfd, 'archive', None) is archive
+    added = 0
+    for has, put, fetch in fetchers:
+        missing, block_nums = tee(x for x in range(start_block, end_block + 1)
+                                  if not has(x))
+        for block_num, value in zip(
+                block_nums, fetch(missing, max_in_flight=max_in_flight)):
+            if value is None:
+                raise ValueError('Block %d is missing on the node' %
+                                 block_num)
+            if put(block_num, value) or client_archives:
+                added += 1
+            if block_num % 100000 == 0:
+                logger.info('Archived up to block %d', block_num)
+    archive.sync()
+    return added
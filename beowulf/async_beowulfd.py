@@ -0,0 +1,296 @@
+# coding=utf-8
+import asyncio
+import logging
+
+from funcy.seqs import first
+
+from beowulfbase.async_http_client import AsyncHttpClient
+from beowulfbase.chains import known_chains
+from .instance import get_config_node_list
+from .utils import compat_compose_dictionary
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBeowulfd(AsyncHttpClient):
+    """ Connect to the Beowulf network from an asyncio event loop.
+
+        Every method of :class:`beowulf.beowulfd.Beowulfd` is available
+        here as a coroutine with the same name and arguments. Properties
+        such as ``head_block_number`` become coroutine methods.
+
+        Args:
+
+            nodes (list): A list of Beowulf HTTP RPC nodes to connect to. If
+            not provided, official beowulfchain nodes will be used.
+
+        Example:
+
+           .. code-block:: python
+
+               async with AsyncBeowulfd(nodes) as s:
+                   head = await s.head_block_number()
+                   blocks = await s.get_blocks_range(head - 100, head)
+
+       """
+
+    def __init__(self, nodes=None, **kwargs):
+        if not nodes:
+            nodes = get_config_node_list()
+
+        assert len(nodes) != 0, "Client need endpoints to connect"
+        super(AsyncBeowulfd, self).__init__(nodes, **kwargs)
+
+    async def chain_params(self):
+        """ Identify the connected network. This call returns a
+            dictionary with keys chain_id, prefix, and other chain
+            specific settings
+        """
+        props = await self.get_config()
+        testnet_chain_flag = props["IS_TEST_NET"]
+
+        if testnet_chain_flag:
+            chain = "TESTNET"
+        else:
+            chain = "MAINNET"
+
+        assert chain in known_chains, "The chain you are connecting " + \
+                                      "to is not supported"
+        return known_chains.get(chain)
+
+    async def last_irreversible_block_num(self):
+        """ Newest irreversible block number. """
+        return (await self.get_dynamic_global_properties())[
+            'last_irreversible_block_num']
+
+    async def head_block_number(self):
+        """ Newest block number. """
+        return (await self.get_dynamic_global_properties())[
+            'head_block_number']
+
+    async def get_account(self, account):
+        """ Lookup account information such as user profile, public keys,
+        balances, etc. """
+        return first(await self.call('get_accounts', [account]))
+
+    async def get_all_usernames(self, last_user=''):
+        """ Fetch the full list of BEOWULF usernames. """
+        usernames = await self.lookup_accounts(last_user, 1000)
+        batch = []
+        while len(batch) != 1:
+            batch = await self.lookup_accounts(usernames[-1], 1000)
+            usernames += batch[1:]
+
+        return usernames
+
+    async def get_blocks(self, block_nums):
+        """ Fetch multiple blocks from beowulfd concurrently.
+
+        Args:
+
+            block_nums (list): A list of all block numbers we would like to
+            fetch.
+
+        Returns:
+
+            list: An ordered list of all `get_block` results, with
+            ``block_num`` added to each block.
+
+        """
+        blocks = await asyncio.gather(
+            *[self.get_block(block_num) for block_num in block_nums])
+        return [compat_compose_dictionary(block, block_num=block_num)
+                for block_num, block in zip(block_nums, blocks)]
+
+    async def get_blocks_range(self, start, end):
+        """ Fetch multiple blocks from beowulfd at once, given a range.
+        ``end`` is not included in results. """
+        return await self.get_blocks(list(range(start, end)))
+
+    async def get_block_header(self, block_num):
+        """ Get block headers, given a block number. """
+        return await self.call(
+            'get_block_header', block_num, api='database_api')
+
+    async def get_block(self, block_num):
+        """ Get the full block, transactions and all, given a block number. """
+        return await self.call('get_block', block_num, api='database_api')
+
+    async def get_ops_in_block(self, block_num, virtual_only):
+        """ get_ops_in_block """
+        return await self.call(
+            'get_ops_in_block', block_num, virtual_only, api='database_api')
+
+    async def get_config(self):
+        """ Get internal chain configuration. """
+        return await self.call('get_config', api='database_api')
+
+    async def get_dynamic_global_properties(self):
+        """ get_dynamic_global_properties """
+        return await self.call(
+            'get_dynamic_global_properties', api='database_api')
+
+    async def get_chain_properties(self):
+        """ Get supernode elected chain properties. """
+        return await self.call('get_chain_properties', api='database_api')
+
+    async def get_supernode_schedule(self):
+        """ get_supernode_schedule """
+        return await self.call('get_supernode_schedule', api='database_api')
+
+    async def get_hardfork_version(self):
+        """ Get the current version of the chain. """
+        return await self.call('get_hardfork_version', api='database_api')
+
+    async def get_next_scheduled_hardfork(self):
+        """ get_next_scheduled_hardfork """
+        return await self.call(
+            'get_next_scheduled_hardfork', api='database_api')
+
+    async def get_accounts(self, account_names):
+        """ get_accounts """
+        return await self.call(
+            'get_accounts', account_names, api='database_api')
+
+    async def lookup_account_names(self, account_names):
+        """ lookup_account_names """
+        return await self.call(
+            'lookup_account_names', account_names, api='database_api')
+
+    async def lookup_accounts(self, after, limit):
+        """ Get a list of usernames from all registered accounts. """
+        return await self.call(
+            'lookup_accounts', after, limit, api='database_api')
+
+    async def get_account_count(self):
+        """ How many accounts are currently registered on BEOWULF? """
+        return await self.call('get_account_count', api='database_api')
+
+    async def get_owner_history(self, account):
+        """ get_owner_history """
+        return await self.call(
+            'get_owner_history', account, api='database_api')
+
+    async def get_transaction_hex(self, signed_transaction):
+        """ get_transaction_hex """
+        return await self.call(
+            'get_transaction_hex', signed_transaction, api='database_api')
+
+    async def get_transaction(self, transaction_id):
+        """ get_transaction """
+        return await self.call(
+            'get_transaction', transaction_id, api='database_api')
+
+    async def get_required_signatures(
+            self, signed_transaction, available_keys):
+        """ get_required_signatures """
+        return await self.call(
+            'get_required_signatures',
+            signed_transaction,
+            available_keys,
+            api='database_api')
+
+    async def get_potential_signatures(self, signed_transaction):
+        """ get_potential_signatures """
+        return await self.call(
+            'get_potential_signatures', signed_transaction, api='database_api')
+
+    async def verify_authority(self, signed_transaction):
+        """ verify_authority """
+        return await self.call(
+            'verify_authority', signed_transaction, api='database_api')
+
+    async def get_account_votes(self, account):
+        """ All votes the given account ever made. """
+        return await self.call(
+            'get_account_votes', account, api='database_api')
+
+    async def get_supernodes(self, supernode_ids):
+        """ get_supernodes """
+        return await self.call(
+            'get_supernodes', supernode_ids, api='database_api')
+
+    async def get_supernode_by_account(self, account):
+        """ get_supernode_by_account """
+        return await self.call(
+            'get_supernode_by_account', account, api='database_api')
+
+    async def get_supernodes_by_vote(self, from_account, limit):
+        """ get_supernodes_by_vote """
+        return await self.call(
+            'get_supernodes_by_vote', from_account, limit, api='database_api')
+
+    async def lookup_supernode_accounts(self, from_account, limit):
+        """ lookup_supernode_accounts """
+        return await self.call(
+            'lookup_supernode_accounts',
+            from_account,
+            limit,
+            api='database_api')
+
+    async def get_supernode_count(self):
+        """ get_supernode_count """
+        return await self.call('get_supernode_count', api='database_api')
+
+    async def get_active_supernodes(self):
+        """ Get a list of currently active supernodes. """
+        return await self.call('get_active_supernodes', api='database_api')
+
+    async def get_version(self):
+        """ Get beowulfd version of the node currently connected to. """
+        return await self.call('get_version', api='login_api')
+
+    async def broadcast_transaction(self, signed_transaction):
+        """ broadcast_transaction """
+        return await self.call(
+            'broadcast_transaction',
+            signed_transaction,
+            api='network_broadcast_api')
+
+    async def broadcast_transaction_synchronous(self, signed_transaction):
+        """ broadcast_transaction_synchronous """
+        return await self.call(
+            'broadcast_transaction_synchronous',
+            signed_transaction,
+            api='network_broadcast_api')
+
+    async def broadcast_block(self, block):
+        """ broadcast_block """
+        return await self.call(
+            'broadcast_block', block, api='network_broadcast_api')
+
+    async def get_key_references(self, public_keys):
+        """ get_key_references """
+        if isinstance(public_keys, str):
+            public_keys = [public_keys]
+        return await self.call(
+            'get_key_references', public_keys, api='account_by_key_api')
+
+    async def find_smt_tokens_by_name(self, name):
+        """ find_smt_tokens_by_name """
+        return await self.call(
+            'find_smt_tokens_by_name', [name], api='database_api')
+
+    async def list_smt_tokens(self):
+        """ list_smt_tokens """
+        return await self.call('list_smt_tokens', api='database_api')
+
+    async def get_balance(self, account, token):
+        """ get_balance """
+        return await self.call(
+            'get_balance', account, token, api='database_api')
+
+    async def get_supernode_voted_by_acc(self, account):
+        """ get_supernode_voted_by_acc """
+        return await self.call(
+            'get_supernode_voted_by_acc', account, api='database_api')
+
+    async def get_pending_transaction_count(self):
+        """ get_pending_transaction_count """
+        return await self.call(
+            'get_pending_transaction_count', api='database_api')
+
+    async def get_transaction_with_status(self, tx_hex):
+        """ get_transaction_with_status """
+        return await self.call(
+            'get_transaction_with_status', tx_hex, api='database_api')
@@ -1,12 +1,19 @@
 # coding=utf-8
+import calendar
+import json
 import logging
+import threading
+import time
+from functools import partial
 
-from funcy.seqs import first
+from funcy.seqs import first, cat, lcat
 
 from beowulfbase.chains import known_chains
+from beowulfbase.concurrency import BULK
 from beowulfbase.http_client import HttpClient
+from .cache import FOREVER, ResponseCache, block_methods, cache_ttl
 from .instance import get_config_node_list
-from .utils import compat_compose_dictionary
+from .utils import compat_compose_dictionary, chunkify
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +26,30 @@ class Beowulfd(HttpClient):
             nodes (list): A list of Beowulf HTTP RPC nodes to connect to. If
             not provided, official beowulfchain nodes will be used.
 
+            batch_size (int): (Defaults to 50) Maximum number of requests
+            sent in one JSON-RPC batch by ``get_blocks`` and
+            ``get_accounts``.
+
+            chain_params (str, dict): Pin the chain instead of asking the
+            node for it, either by name (``'MAINNET'``, ``'TESTNET'``) or as
+            a dictionary like those in ``beowulfbase.chains.known_chains``.
+            With a pinned chain, signing transactions needs no RPC.
+
+            cache (ResponseCache): Cache for responses which do not change,
+            such as irreversible blocks and the chain configuration (see
+            ``beowulf.cache``). Defaults to an in-memory LRU; pass
+            ``False`` to disable caching.
+
+            archive (BlockArchive): Local archive of irreversible blocks
+            and their operations (see ``beowulf.archive``). ``get_block``,
+            ``get_ops_in_block`` and the block streams read from it before
+            asking the node, and add the irreversible blocks they fetch.
+
+            block_interval (float): (Defaults to 3) Seconds between blocks.
+            ``get_dynamic_global_properties`` is answered from a snapshot
+            until the next block is expected, see its ``max_age``
+            argument. ``0`` disables the snapshot.
+
         Returns:
 
             Beowulfd class instance. It can be used to execute commands
@@ -47,15 +78,175 @@ class Beowulfd(HttpClient):
             nodes = get_config_node_list()
 
         assert len(nodes) != 0, "Client need endpoints to connect"
+        self.batch_size = kwargs.get('batch_size', 50)
+        cache = kwargs.get('cache', None)
+        self.cache = ResponseCache() if cache is None else cache or None
+        self._last_irreversible_block_num = None
+        self.archive = kwargs.get('archive')
+        self._archive_bound = False
+        self.block_interval = kwargs.get('block_interval', 3)
+        self._props = None
+        self._props_fetched = 0.0
+        self._props_expires = 0.0
+        self._props_lock = threading.Lock()
+        self._pinned_chain_params = None
+        self._node_chain_params = {}
         super(Beowulfd, self).__init__(nodes, **kwargs)
+        if kwargs.get('chain_params'):
+            self.pin_chain_params(kwargs['chain_params'])
+
+    def _cache_key(self, name, args):
+        key = '%s:%s' % (name, json.dumps(args, sort_keys=True))
+        # persisted entries outlive this process, so they need to be bound
+        # to the chain they were fetched from
+        persist = name in block_methods and self.cache.disk is not None
+        if persist:
+            key = '%s:%s' % (self.chain_params['chain_id'], key)
+        return key, persist
+
+    def _archive_get(self, name, args):
+        try:
+            if name == 'get_block':
+                return self.archive.get_block(int(args[0]))
+            if name == 'get_ops_in_block':
+                return self.archive.get_ops(int(args[0]), bool(args[1]))
+        except (IndexError, TypeError, ValueError):
+            pass
+        return None
+
+    def _archivable(self, name, args):
+        """ ``True`` if the response of ``name(*args)`` is to be added to
+        ``self.archive``: a block, or all the operations of a block, once
+        it is irreversible. """
+        if self.archive is None or self.archive.readonly:
+            return False
+        if name == 'get_ops_in_block' and (len(args) < 2 or args[1]):
+            # only complete operation lists are archived
+            return False
+        return name in ('get_block', 'get_ops_in_block') and \
+            cache_ttl(name, args,
+                      self._last_irreversible_block_num) == FOREVER
+
+    def _archive_set(self, name, args, value):
+        if not self._archivable(name, args):
+            return
+        if not self._archive_bound:
+            self.archive.bind_chain(self.chain_params['chain_id'])
+            self._archive_bound = True
+        if name == 'get_block':
+            self.archive.put_block(int(args[0]), value)
+        else:
+            self.archive.put_ops(int(args[0]), value)
+
+    def _cache_get(self, name, args):
+        if self.archive is not None:
+            result = self._archive_get(name, args)
+            if result is not None:
+                return result
+        if self.cache is None or cache_ttl(name, args) is None:
+            return None
+        key, persist = self._cache_key(name, args)
+        return self.cache.get(key, persist=persist)
+
+    def _cache_set(self, name, args, value):
+        if value is None:
+            return
+        if self.archive is not None:
+            self._archive_set(name, args, value)
+        if self.cache is None:
+            return
+        ttl = cache_ttl(name, args, self._last_irreversible_block_num,
+                        self.cache.short_ttl)
+        if ttl is None:
+            return
+        key, persist = self._cache_key(name, args)
+        self.cache.set(key, value, ttl, persist=persist)
+
+    def call(self, name, *args, **kwargs):
+        """ Call a remote procedure in beowulfd.
+
+        Responses that are known not to have changed are answered from
+        ``self.archive`` or ``self.cache``; see ``beowulf.cache.cache_ttl``
+        for the rules.
+        """
+        cacheable = (self.cache is not None or self.archive is not None) \
+            and set(kwargs) <= {'api'}
+        result = self._cache_get(name, args) if cacheable else None
+        if result is None:
+            result = super(Beowulfd, self).call(name, *args, **kwargs)
+            if cacheable:
+                self._cache_set(name, args, result)
+
+        if name == 'get_dynamic_global_properties' and result:
+            self._last_irreversible_block_num = max(
+                self._last_irreversible_block_num or 0,
+                result['last_irreversible_block_num'])
+        return result
 
     @property
     def chain_params(self):
         """ Identify the connected network. This call returns a
             dictionary with keys chain_id, prefix, and other chain
             specific settings
+
+            The result is resolved once per node and kept until
+            ``invalidate_chain_params()`` is called, unless the chain was
+            pinned with ``pin_chain_params()``.
+        """
+        if self._pinned_chain_params is not None:
+            return self._pinned_chain_params
+
+        url = self.url
+        params = self._node_chain_params.get(url)
+        if params is None:
+            params = self._resolve_chain_params(url)
+            self._node_chain_params[url] = params
+        return params
+
+    def pin_chain_params(self, chain):
+        """ Use ``chain`` as the chain parameters for every node, without
+        asking the nodes.
+
+        Args:
+            chain (str, dict): A key of ``known_chains`` (ie: ``'MAINNET'``)
+                or a dictionary with at least chain_id and prefix.
+        """
+        if not isinstance(chain, dict):
+            assert chain in known_chains, "The chain you are connecting " + \
+                                          "to is not supported"
+            chain = known_chains[chain]
+        assert "chain_id" in chain and "prefix" in chain, \
+            "chain_params need a chain_id and a prefix"
+        self._pinned_chain_params = chain
+
+    def invalidate_chain_params(self, url=None):
+        """ Forget the chain parameters resolved for node ``url``, or for
+        all nodes if ``url`` is not given. A pinned chain is unpinned too.
         """
-        props = self.get_config()
+        if url is None:
+            self._node_chain_params.clear()
+            self._pinned_chain_params = None
+        else:
+            self._node_chain_params.pop(url, None)
+        if self.cache is not None:
+            self.cache.memory.delete(self._cache_key('get_config', ())[0])
+
+    def _apply_capabilities(self, url, capabilities):
+        """ Also take the chain of ``url`` from its probed capabilities,
+        so that signing needs no ``get_config`` call. """
+        super(Beowulfd, self)._apply_capabilities(url, capabilities)
+        for chain in known_chains.values():
+            if chain['chain_id'] == capabilities.get('chain_id'):
+                self._node_chain_params[url] = chain
+                break
+
+    def _resolve_chain_params(self, url):
+        try:
+            props = self._request_node(url, 'get_config', api='database_api')
+        except Exception as e:
+            logger.info('Could not read chain config from %s -- %s: %s',
+                        url, e.__class__.__name__, e)
+            props = self.get_config()
         testnet_chain_flag = props["IS_TEST_NET"]
 
         if testnet_chain_flag:
@@ -101,24 +292,108 @@ class Beowulfd(HttpClient):
 
         return usernames
 
-    def _get_blocks(self, blocks):
-        """ Fetch multiple blocks from beowulfd at once.
+    def _fetch_blocks(self, block_nums):
+        """ Fetch a chunk of blocks with a single batch request, skipping
+        the ones which are cached. Returns them in the order of
+        ``block_nums``; blocks the node does not have are ``None``. """
+        blocks = [self._cache_get('get_block', (x,)) for x in block_nums]
+        missing = [x for x, block in zip(block_nums, blocks) if not block]
+        if missing:
+            fetched = dict(zip(missing, self.call_batch(
+                [('get_block', [x], 'database_api') for x in missing])))
+            for x, block in fetched.items():
+                self._cache_set('get_block', (x,), block)
+            blocks = [block or fetched[x]
+                      for x, block in zip(block_nums, blocks)]
+        return blocks
+
+    def stream_blocks(self, block_nums, max_in_flight=None,
+                      add_block_num=True):
+        """ Fetch multiple blocks from beowulfd concurrently, yielding them
+        in order as soon as they are available.
+
+        Only ``max_in_flight`` requests (batches of ``batch_size`` blocks
+        if the node supports batch requests) are outstanding at a time, so
+        memory stays bounded however long ``block_nums`` is.
+
+        Args:
+
+            block_nums (iterable): Block numbers, may be a generator.
+
+            max_in_flight (int): Number of concurrent requests. Defaults
+            to the adaptive concurrency limit of the node.
+
+            add_block_num (bool): (Defaults to True) Add ``block_num`` to
+            each block.
+
+        The requests are sent with ``BULK`` priority, so that other calls
+        of the client are served first when the node's limit is reached.
+
+        Returns:
+
+            A generator of `get_block` results, with ``block_num`` added,
+            or ``None`` for blocks the node does not have (yet).
 
-        Warning: This method does not ensure that all blocks are returned,
-        or that the results are ordered.  You will probably want to use
-        `beowulfd.get_blocks()` instead.
+        """
+        if self._curr_node_batches():
+            blocks = cat(self.imap(
+                self._fetch_blocks, chunkify(block_nums, self.batch_size),
+                max_in_flight=max_in_flight, priority=BULK))
+        else:
+            blocks = self.imap(self.get_block, block_nums,
+                               max_in_flight=max_in_flight, priority=BULK)
+
+        for block in blocks:
+            if block and add_block_num:
+                block = compat_compose_dictionary(
+                    block, block_num=int(block['block_id'][:8], base=16))
+            yield block
+
+    def _fetch_ops_in_blocks(self, block_nums, virtual_only=False):
+        """ Like ``_fetch_blocks``, for ``get_ops_in_block``. """
+        ops = [self._cache_get('get_ops_in_block', (x, virtual_only))
+               for x in block_nums]
+        missing = [x for x, block_ops in zip(block_nums, ops)
+                   if block_ops is None]
+        if missing:
+            fetched = dict(zip(missing, self.call_batch(
+                [('get_ops_in_block', [x, virtual_only], 'database_api')
+                 for x in missing])))
+            for x, block_ops in fetched.items():
+                self._cache_set('get_ops_in_block', (x, virtual_only),
+                                block_ops)
+            ops = [fetched[x] if block_ops is None else block_ops
+                   for x, block_ops in zip(block_nums, ops)]
+        return ops
+
+    def stream_ops_in_blocks(self, block_nums, virtual_only=False,
+                             max_in_flight=None):
+        """ Like ``stream_blocks``, for the operations of each block.
 
         Args:
-            blocks (list): A list, or a set of block numbers.
+
+            block_nums (iterable): Block numbers, may be a generator.
+
+            virtual_only (bool): Only yield virtual operations.
+
+            max_in_flight (int): Number of concurrent requests. Defaults
+            to the adaptive concurrency limit of the node.
 
         Returns:
-            A generator with results.
+
+            A generator with the `get_ops_in_block` result of each block,
+            in order.
 
         """
-        results = self.call_multi_with_futures(
-            'get_block', blocks, max_workers=10)
-        return (compat_compose_dictionary(x, block_num=int(x['block_id'][:8], base=16))
-                for x in results if x)
+        if self._curr_node_batches():
+            return cat(self.imap(
+                partial(self._fetch_ops_in_blocks,
+                        virtual_only=virtual_only),
+                chunkify(block_nums, self.batch_size),
+                max_in_flight=max_in_flight, priority=BULK))
+        return self.imap(
+            partial(self.get_ops_in_block, virtual_only=virtual_only),
+            block_nums, max_in_flight=max_in_flight, priority=BULK)
 
     def get_blocks(self, block_nums):
         """ Fetch multiple blocks from beowulfd at once, given a range.
@@ -130,22 +405,21 @@ class Beowulfd(HttpClient):
 
         Returns:
 
-            dict: An ensured and ordered list of all `get_block` results.
+            list: An ensured and ordered list of all `get_block` results.
 
         """
-        required = set(block_nums)
-        available = set()
-        missing = required - available
-        blocks = {}
-
-        while missing:
-            for block in self._get_blocks(missing):
-                blocks[block['block_num']] = block
-
-            available = set(blocks.keys())
-            missing = required - available
-
-        return [blocks[x] for x in block_nums]
+        block_nums = list(block_nums)
+        blocks = []
+        for block_num, block in zip(block_nums,
+                                    self.stream_blocks(block_nums)):
+            # the node may not have the block yet; wait for it
+            while not block:
+                block = self.get_block(block_num)
+                if block:
+                    block = compat_compose_dictionary(
+                        block, block_num=block_num)
+            blocks.append(block)
+        return blocks
 
     def get_blocks_range(self, start, end):
         """ Fetch multiple blocks from beowulfd at once, given a range.
@@ -207,13 +481,88 @@ class Beowulfd(HttpClient):
         return self.call(
             'get_ops_in_block', block_num, virtual_only, api='database_api')
 
+    def iter_ops_in_block(self, block_num, virtual_only=False):
+        """ Like ``get_ops_in_block``, but yield the operations while the
+        response is being parsed instead of decoding it all at once.
+
+        Archived and cached responses are served from ``self.archive`` and
+        ``self.cache``; streamed ones are not cached. Operations of blocks
+        which go to ``self.archive`` are fetched with ``get_ops_in_block``
+        instead, so that they are archived.
+        """
+        args = (block_num, virtual_only)
+        cached = self._cache_get('get_ops_in_block', args)
+        if cached is not None:
+            return iter(cached)
+        if self._archivable('get_ops_in_block', args):
+            return iter(self.get_ops_in_block(block_num, virtual_only))
+        return self.call_iter(
+            'get_ops_in_block', block_num, virtual_only, api='database_api')
+
     def get_config(self):
         """ Get internal chain configuration. """
         return self.call('get_config', api='database_api')
 
-    def get_dynamic_global_properties(self):
-        """ get_dynamic_global_properties """
-        return self.call('get_dynamic_global_properties', api='database_api')
+    def get_dynamic_global_properties(self, max_age=None):
+        """ get_dynamic_global_properties
+
+        The properties only change with each block, so the last response
+        is shared by all callers until the next block is expected: the
+        head block time plus ``block_interval``, as seen by the local
+        clock. If the node still has the same head block then, the
+        snapshot is kept for a tenth of an interval more.
+
+        Args:
+            max_age (float): Accept a snapshot fetched at most this many
+                seconds ago, even if a new block is expected. ``0``
+                always asks the node. Defaults to the block-aligned
+                expiry.
+
+        Returns:
+            dict: The properties, shared with other callers; do not
+            modify it.
+        """
+        if not self.block_interval:
+            return self.call('get_dynamic_global_properties',
+                             api='database_api')
+        with self._props_lock:
+            now = time.time()
+            if self._props is not None:
+                if max_age is None and now < self._props_expires:
+                    return self._props
+                if max_age is not None and now - self._props_fetched <= \
+                        max_age:
+                    return self._props
+            return self._refresh_props()
+
+    def refresh(self):
+        """ Fetch ``get_dynamic_global_properties`` from the node now,
+        replacing the shared snapshot, and return it. """
+        if not self.block_interval:
+            return self.get_dynamic_global_properties()
+        with self._props_lock:
+            return self._refresh_props()
+
+    def _refresh_props(self):
+        # called with self._props_lock held
+        previous = self._props
+        props = self.call('get_dynamic_global_properties',
+                          api='database_api')
+        now = time.time()
+        head_time = calendar.timegm(
+            time.strptime(props['time'], '%Y-%m-%dT%H:%M:%S'))
+        # a local clock behind the chain must not keep the snapshot for
+        # more than a block; with one ahead, the snapshot expires at once
+        # until the node has the next block
+        ttl = min(max(head_time + self.block_interval - now, 0),
+                  self.block_interval)
+        if previous is not None and \
+                previous['head_block_number'] == props['head_block_number']:
+            ttl = max(ttl, self.block_interval / 10.0)
+        self._props = props
+        self._props_fetched = now
+        self._props_expires = now + ttl
+        return props
 
     def get_chain_properties(self):
         """ Get supernode elected chain properties.
@@ -249,9 +598,14 @@ class Beowulfd(HttpClient):
         balances, etc.
 
         This method is same as ``get_account``, but supports querying for
-        multiple accounts at the time.
+        multiple accounts at the time. Long lists are split into chunks of
+        ``batch_size`` names and fetched in a single batch request.
 
         """
+        if len(account_names) > self.batch_size and self._curr_node_batches():
+            return lcat(self.call_batch(
+                [('get_accounts', [chunk], 'database_api')
+                 for chunk in chunkify(account_names, self.batch_size)]))
         return self.call('get_accounts', account_names, api='database_api')
 
     def lookup_account_names(self, account_names):
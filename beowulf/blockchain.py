@@ -1,13 +1,56 @@
+import calendar
 import hashlib
 import json
+import struct
 import time
 import warnings
+from collections import namedtuple
+from functools import partial
+from .beowulfd import Beowulfd
 from .instance import shared_beowulfd_instance
 from .utils import parse_time, compat_bytes
 import logging
 
 logger = logging.getLogger(__name__)
 
+#: operations yielded by ``Blockchain.stream(lean=True)``; ``op`` is the
+#: operation as returned by beowulfd and ``timestamp`` is not parsed
+StreamOp = namedtuple('StreamOp', ['id', 'type', 'op', 'block_num', 'trx_id',
+                                   'timestamp'])
+
+# block_num, trx_in_block, op_in_trx, virtual_op
+_op_key = struct.Struct('>IIHI')
+
+
+def block_timestamp(block_time):
+    """ Seconds since the epoch of a block time string (UTC). """
+    return calendar.timegm(parse_time(block_time).timetuple())
+
+
+def next_poll_delay(head_time, block_interval, misses=0, now=None,
+                    margin=0.1, min_backoff=0.1):
+    """ Seconds to wait before polling for the block after the head.
+
+    The next block is due ``block_interval`` seconds after the head block
+    was produced, and is polled for ``margin`` seconds later. When it is
+    already due (the block is late, or the local clock is ahead of the
+    chain), polls back off exponentially from ``min_backoff`` with the
+    number of ``misses``, polls that found no new block. No wait is
+    longer than ``block_interval``.
+
+    Args:
+        head_time (float): Timestamp of the head block.
+        block_interval (float): Seconds between blocks.
+        misses (int): Consecutive polls without a new block.
+        now (float): Current time, defaults to ``time.time()``.
+    """
+    if now is None:
+        now = time.time()
+    delay = head_time + block_interval + margin - now
+    if delay <= 0:
+        delay = min_backoff * 2 ** misses
+    return min(delay, block_interval)
+
 
 class Blockchain(object):
     """ Access the blockchain and read data from it.
@@ -19,6 +62,8 @@ class Blockchain(object):
 
     def __init__(self, beowulfd_instance=None, mode="irreversible"):
         self.beowulf = beowulfd_instance or shared_beowulfd_instance()
+        #: seconds from production to delivery of the last streamed block
+        self.last_block_lateness = None
 
         if mode == "irreversible":
             self.mode = 'last_irreversible_block_num'
@@ -50,6 +95,7 @@ class Blockchain(object):
                     end_block=None,
                     batch_operations=False,
                     full_blocks=False,
+                    prefetch=None,
                     **kwargs):
         """ This call yields raw blocks or operations depending on
         ``full_blocks`` param.
@@ -72,6 +118,19 @@ class Blockchain(object):
         operations, return raw, unedited blocks as provided by beowulfd. This
         mode will NOT include virtual operations.
 
+        prefetch (int): Number of requests kept in flight while more than
+        one block is behind the head, e.g. when catching up after
+        downtime. Results are still yielded in block order, and at most
+        ``prefetch`` requests (of up to ``batch_size`` blocks each) are
+        held in memory. Once caught up, blocks are fetched one by one
+        again. Defaults to the adaptive concurrency limit of the node;
+        ``0`` always fetches blocks one by one.
+
+        At the head, the next block is polled for just after it is due
+        (see ``next_poll_delay``). How late each block is delivered,
+        relative to its timestamp, is kept in ``last_block_lateness`` and
+        reported to the ``on_block`` hook of the client's ``metrics``.
+
        """
 
         _ = kwargs  # we need this
@@ -81,25 +140,76 @@ class Blockchain(object):
         if not start_block:
             start_block = self.get_current_block_num()
 
+        last_head, misses = None, 0
         while True:
-            head_block = self.get_current_block_num()
-
-            for block_num in range(start_block, head_block + 1):
-                if end_block and block_num > end_block:
-                    raise StopIteration(
-                        "Reached stop block at: #%s" % end_block)
-
+            props = self.beowulf.get_dynamic_global_properties(max_age=0)
+            head_block = props[self.mode]
+            block_nums = range(start_block, head_block + 1)
+            if end_block:
+                block_nums = range(start_block,
+                                   min(head_block, end_block) + 1)
+
+            for block_num, data in self._fetch(
+                    block_nums, batch_operations, full_blocks, prefetch):
                 if full_blocks:
-                    yield self.beowulf.get_block(block_num)
+                    if data:
+                        self._delivered(block_num, data['timestamp'])
+                    yield data
                 elif batch_operations:
-                    yield self.beowulf.get_ops_in_block(block_num, False)
+                    if data:
+                        self._delivered(block_num, data[0]['timestamp'])
+                    yield data
                 else:
-                    for ops in self.beowulf.get_ops_in_block(block_num, False):
-                        yield ops
+                    for i, op in enumerate(data):
+                        if not i:
+                            self._delivered(block_num, op['timestamp'])
+                        yield op
+
+            if end_block and head_block >= end_block:
+                # raising StopIteration in a generator is an error
+                # since python 3.7 (PEP 479)
+                logger.debug("Reached stop block at: #%s", end_block)
+                return
 
             # next round
-            start_block = head_block + 1
-            time.sleep(block_interval)
+            misses = misses + 1 if head_block == last_head else 0
+            last_head = head_block
+            start_block = max(start_block, head_block + 1)
+            time.sleep(next_poll_delay(block_timestamp(props['time']),
+                                       block_interval, misses))
+
+    def _fetch(self, block_nums, batch_operations, full_blocks, prefetch):
+        """ Yield ``(block_num, data)`` for ``stream_from``, in block order.
+        ``data`` is the block, or the operations of the block. """
+        if len(block_nums) > 1 and prefetch != 0:
+            if full_blocks:
+                data = self.beowulf.stream_blocks(
+                    block_nums, max_in_flight=prefetch, add_block_num=False)
+            else:
+                data = self.beowulf.stream_ops_in_blocks(
+                    block_nums, max_in_flight=prefetch)
+            return zip(block_nums, data)
+
+        if full_blocks:
+            fetch = self.beowulf.get_block
+        elif batch_operations:
+            fetch = partial(self.beowulf.get_ops_in_block,
+                            virtual_only=False)
+        else:
+            # operations are yielded one by one, as they are parsed
+            fetch = self.beowulf.iter_ops_in_block
+        return ((block_num, fetch(block_num)) for block_num in block_nums)
+
+    def _delivered(self, block_num, timestamp):
+        """ Report how late block ``block_num``, produced at ``timestamp``,
+        is being delivered. """
+        lateness = time.time() - block_timestamp(timestamp)
+        self.last_block_lateness = lateness
+        logger.debug('Delivering block %s, %.2fs after production',
+                     block_num, lateness)
+        metrics = getattr(self.beowulf, 'metrics', None)
+        if metrics is not None:
+            metrics.on_block(block_num, lateness)
 
     def reliable_stream(self,
                         start_block=None,
@@ -146,7 +256,7 @@ class Blockchain(object):
 
         def get_reliable_client(_timeout):
             # we want to fail fast and try the next node quickly
-            return self.beowulf.Beowulfd(
+            return Beowulfd(
                 nodes=self.beowulf.nodes,
                 retries=1,
                 timeout=_timeout,
@@ -159,10 +269,9 @@ class Blockchain(object):
                     return _client.call(_method, *_args, api=_api)
                 except Exception as e:
                     logger.error(
-                        'Error: %s' % str(s),
+                        'Error: %s' % str(e),
                         extra=dict(
                             exc=e,
-                            response=retval,
                             api_name=_api,
                             api_method=_method,
                             api_args=_args))
@@ -172,17 +281,17 @@ class Blockchain(object):
             return reliable_query(_client, 'get_config',
                                   'database_api').get('BWF_BLOCK_INTERVAL')
 
-        def get_reliable_current_block(_client):
+        def get_reliable_props(_client):
             return reliable_query(_client, 'get_dynamic_global_properties',
-                                  'database_api').get(self.mode)
+                                  'database_api')
 
         def get_reliable_blockdata(_client, _block_num):
             return reliable_query(_client, 'get_block', 'database_api',
-                                  block_num)
+                                  _block_num)
 
         def get_reliable_ops_in_block(_client, _block_num):
             return reliable_query(_client, 'get_ops_in_block', 'database_api',
-                                  block_num, False)
+                                  _block_num, False)
 
         if timeout is None:
             if block_interval is None:
@@ -196,38 +305,95 @@ class Blockchain(object):
         if block_interval is None:
             block_interval = get_reliable_block_interval(_reliable_client)
         if start_block is None:
-            start_block = get_reliable_current_block(_reliable_client)
+            start_block = get_reliable_props(_reliable_client)[self.mode]
 
+        last_head, misses = None, 0
         while True:
-            sleep_interval = block_interval / 4
-            head_block = get_reliable_current_block(_reliable_client)
+            props = get_reliable_props(_reliable_client)
+            head_block = props[self.mode]
 
             for block_num in range(start_block, head_block + 1):
                 if full_blocks:
-                    yield get_reliable_current_block(_reliable_client,
-                                                     head_block)
-                elif batch_operations:
-                    yield get_reliable_ops_in_block(_reliable_client,
-                                                    head_block)
+                    block = get_reliable_blockdata(_reliable_client,
+                                                   block_num)
+                    if block:
+                        self._delivered(block_num, block['timestamp'])
+                    yield block
+                    continue
+
+                reliable_ops = get_reliable_ops_in_block(_reliable_client,
+                                                         block_num)
+                if reliable_ops:
+                    self._delivered(block_num, reliable_ops[0]['timestamp'])
+                if batch_operations:
+                    yield reliable_ops
                 else:
-                    for reliable_ops in get_reliable_ops_in_block(
-                            _reliable_client, head_block):
-                        yield reliable_ops
-
-                sleep_interval = sleep_interval / 2
+                    for op in reliable_ops:
+                        yield op
 
-            time.sleep(sleep_interval)
-            start_block = head_block + 1
+            misses = misses + 1 if head_block == last_head else 0
+            last_head = head_block
+            start_block = max(start_block, head_block + 1)
+            time.sleep(next_poll_delay(block_timestamp(props['time']),
+                                       block_interval, misses))
 
     def stream(self, filter_by=list(), *args, **kwargs):
         """ Yield a stream of operations, starting with current head block.
 
             Args:
                 filter_by (str, list): List of operations to filter for
+                op_ids (str): How the ``_id`` of each operation is made:
+                    ``'hash'`` (default) with ``hash_op``, ``'position'``
+                    or ``'binary'`` with the much cheaper ``op_id``.
+                lean (bool): Yield a ``StreamOp`` tuple per operation,
+                    without copying the operation nor parsing its time.
+                    The operation is shared with the client's cache and
+                    must not be modified.
+                checkpoint (Checkpoint): Resume right after the position
+                    saved in this ``beowulf.checkpoint.Checkpoint``
+                    (instead of at ``start_block``), and keep it up to
+                    date as operations are processed.
         """
         if isinstance(filter_by, str):
             filter_by = [filter_by]
 
+        checkpoint = kwargs.pop('checkpoint', None)
+        if checkpoint is None:
+            for op in self._stream(filter_by, *args, **kwargs):
+                yield op
+            return
+
+        resume = checkpoint.position
+        if resume is not None:
+            kwargs['start_block'] = resume[0]
+        position = None
+        try:
+            for position, op in self._stream(filter_by, *args,
+                                             with_position=True, **kwargs):
+                if resume is not None and position <= resume:
+                    continue
+                if op is not None:
+                    checkpoint.delivered = position
+                    yield op
+                # the consumer asked for the next operation
+                checkpoint.done(*position)
+        finally:
+            checkpoint.commit()
+
+    def _stream(self, filter_by, *args, **kwargs):
+        """ Operations for ``stream``. With ``with_position``, yield
+        ``((block_num, op_index), op)`` for every operation, where ``op``
+        is ``None`` for operations that are filtered out. """
+        with_position = kwargs.pop('with_position', False)
+        lean = kwargs.pop('lean', False)
+        make_id = {
+            'hash': self.hash_op,
+            'position': self.op_id,
+            'binary': partial(self.op_id, binary=True),
+        }[kwargs.pop('op_ids', 'hash')]
+        block_num, op_index = None, -1
+        # all operations of a block share its timestamp
+        last_time, last_parsed = None, None
         for ops in self.stream_from(*args, **kwargs):
 
             # deal with different self.stream_from() outputs
@@ -241,21 +407,40 @@ class Blockchain(object):
                 events = [ops]
 
             for event in events:
+                if with_position:
+                    if event.get('block') != block_num:
+                        block_num, op_index = event.get('block'), -1
+                    op_index += 1
                 op_type, op = event['op']
                 if not filter_by or op_type in filter_by:
                     # return unmodified beowulfd output
                     if kwargs.get('raw_output'):
-                        yield event
+                        result = event
+                    elif lean:
+                        result = StreamOp(make_id(event), op_type, op,
+                                          event.get("block"),
+                                          event.get("trx_id"),
+                                          event.get("timestamp"))
                     else:
-                        updated_op = op.copy()
-                        updated_op.update({
-                            "_id": self.hash_op(event),
+                        timestamp = event.get("timestamp")
+                        if timestamp != last_time:
+                            last_time = timestamp
+                            last_parsed = parse_time(timestamp)
+                        result = dict(op, **{
+                            "_id": make_id(event),
                             "type": op_type,
-                            "timestamp": parse_time(event.get("timestamp")),
+                            "timestamp": last_parsed,
                             "block_num": event.get("block"),
                             "trx_id": event.get("trx_id"),
                         })
-                        yield updated_op
+                elif with_position:
+                    result = None
+                else:
+                    continue
+                if with_position:
+                    yield (block_num, op_index), result
+                else:
+                    yield result
 
     def history(self,
                 filter_by=list(),
@@ -274,7 +459,9 @@ class Blockchain(object):
         end_block (int): Stop iterating at this
             block. If not provided, this generator will run forever.
         raw_output (bool): (Defaults to False). If True, return ops in a
-            unmodified beowulfd structure. """
+            unmodified beowulfd structure.
+        checkpoint (Checkpoint): Resume from and record the position of
+            the consumer, see ``stream()``. """
 
         return self.stream(
             filter_by=filter_by,
@@ -298,6 +485,28 @@ class Blockchain(object):
         data = json.dumps(event, sort_keys=True)
         return hashlib.sha1(compat_bytes(data, 'utf-8')).hexdigest()
 
+    @staticmethod
+    def op_id(event, binary=False):
+        """ Identify an operation by its position in the chain: block
+        number, transaction in the block, operation in the transaction and
+        virtual operation number, as ``'block/trx/op/virtual'``.
+
+        Unlike ``hash_op``, it needs no serialization, and is the same for
+        an operation whatever node or API version it comes from.
+
+        Args:
+            event (dict): An operation as returned by ``get_ops_in_block``.
+            binary (bool): Return 14 packed bytes instead, which sort in
+                chain order.
+        """
+        key = (event['block'], event['trx_in_block'], event['op_in_trx'],
+               event['virtual_op'])
+        if binary:
+            # transaction-less virtual operations may use -1
+            return _op_key.pack(key[0], key[1] & 0xFFFFFFFF, key[2],
+                                key[3])
+        return '%d/%d/%d/%d' % key
+
     def get_all_usernames(self, *args, **kwargs):
         """ Fetch the full list of BWF usernames. """
         _ = args, kwargs
@@ -0,0 +1,221 @@
+# coding=utf-8
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from appdirs import user_data_dir
+
+logger = logging.getLogger(__name__)
+
+#: ttl of responses which never change
+FOREVER = float('inf')
+
+#: methods whose response never changes on a given chain
+immutable_methods = frozenset([
+    'get_config',
+])
+
+#: methods whose response never changes once the block they are asked
+#: about is irreversible, mapped to the position of the block number
+block_methods = {
+    'get_block': 0,
+    'get_block_header': 0,
+    'get_ops_in_block': 0,
+}
+
+#: methods whose response changes rarely, cached for a short time
+slow_changing_methods = frozenset([
+    'find_smt_tokens_by_name',
+    'get_active_supernodes',
+    'get_chain_properties',
+    'get_hardfork_version',
+    'get_next_scheduled_hardfork',
+    'get_supernode_schedule',
+    'get_version',
+    'list_smt_tokens',
+])
+
+
+def cache_ttl(name, args, last_irreversible_block_num=None, short_ttl=3):
+    """ Decide for how long the response of an RPC call may be cached.
+
+    Args:
+        name (str): RPC method name (ie: `get_block`).
+        args (tuple): Positional arguments of the call.
+        last_irreversible_block_num (int): Newest irreversible block known
+            to the caller, or ``None`` if unknown.
+        short_ttl (float): Seconds to cache responses that may change.
+
+    Returns:
+        float: ``FOREVER`` for immutable responses, ``short_ttl`` for
+        slowly changing ones or ``None`` if the response must not be
+        cached. Blocks above the last irreversible block may still be
+        replaced by a fork, so they are only cached for ``short_ttl``.
+    """
+    if name in immutable_methods:
+        return FOREVER
+    if name in block_methods:
+        try:
+            block_num = int(args[block_methods[name]])
+        except (IndexError, TypeError, ValueError):
+            return None
+        if last_irreversible_block_num is not None and \
+                block_num <= last_irreversible_block_num:
+            return FOREVER
+        return short_ttl
+    if name in slow_changing_methods:
+        return short_ttl
+    return None
+
+
+class LRUCache(object):
+    """ Bounded, thread-safe in-memory cache with per-entry expiry.
+
+    Args:
+        maxsize (int): Maximum number of entries. The least recently used
+            entry is evicted first.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=FOREVER):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteCache(object):
+    """ On-disk cache for responses which never change.
+
+    Entries are stored as JSON in a SQLite database and never expire.
+
+    Args:
+        path (str): Database file. Defaults to ``rpc_cache.sqlite`` in the
+            beowulf user data directory.
+    """
+    __tablename__ = 'rpc_cache'
+
+    def __init__(self, path=None):
+        if path is None:
+            data_dir = user_data_dir("BWF", "BeowulfTeam")
+            if not os.path.isdir(data_dir):
+                os.makedirs(data_dir)
+            path = os.path.join(data_dir, 'rpc_cache.sqlite')
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'key TEXT PRIMARY KEY, value TEXT)' % self.__tablename__)
+        self._connection.commit()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value FROM %s WHERE key=?' % self.__tablename__,
+                (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=FOREVER):
+        if ttl != FOREVER:
+            return
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' %
+                self.__tablename__, (key, json.dumps(value)))
+            self._connection.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._connection.execute(
+                'DELETE FROM %s WHERE key=?' % self.__tablename__, (key,))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM %s' % self.__tablename__)
+            self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+class ResponseCache(object):
+    """ Response cache used by :class:`beowulf.beowulfd.Beowulfd`.
+
+    Lookups go to the in-memory LRU first and then to the optional disk
+    backend; disk hits are promoted to memory. Only responses cached
+    ``FOREVER`` are written to disk.
+
+    Cached responses are shared between callers and must be treated as
+    read-only.
+
+    Args:
+        maxsize (int): Size of the in-memory LRU.
+        disk (SqliteCache): Optional persistent backend.
+        short_ttl (float): Seconds to keep responses that may change.
+
+    .. code-block:: python
+
+       from beowulf.cache import ResponseCache, SqliteCache
+
+       s = Beowulfd(nodes, cache=ResponseCache(disk=SqliteCache()))
+
+    """
+
+    def __init__(self, maxsize=1024, disk=None, short_ttl=3):
+        self.memory = LRUCache(maxsize)
+        self.disk = disk
+        self.short_ttl = short_ttl
+
+    def get(self, key, default=None, persist=False):
+        value = self.memory.get(key, default)
+        if value is default and persist and self.disk is not None:
+            value = self.disk.get(key, default)
+            if value is not default:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value, ttl=FOREVER, persist=False):
+        self.memory.set(key, value, ttl)
+        if persist and self.disk is not None and ttl == FOREVER:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,204 @@
+# coding=utf-8
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from appdirs import user_data_dir
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCheckpointStore(object):
+    """ Stream positions kept in a SQLite database.
+
+    Every ``save`` is a durable transaction (``synchronous=FULL``), so
+    callers should batch them, see :class:`Checkpoint`.
+
+    Args:
+        path (str): Database file. Defaults to ``checkpoints.sqlite`` in
+            the beowulf user data directory.
+    """
+    __tablename__ = 'checkpoints'
+
+    def __init__(self, path=None):
+        if path is None:
+            data_dir = user_data_dir("BWF", "BeowulfTeam")
+            if not os.path.isdir(data_dir):
+                os.makedirs(data_dir)
+            path = os.path.join(data_dir, 'checkpoints.sqlite')
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA synchronous=FULL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'name TEXT PRIMARY KEY, block_num INTEGER, op_index INTEGER, '
+            'updated REAL)' % self.__tablename__)
+        self._connection.commit()
+
+    def load(self, name):
+        """ Return the saved ``(block_num, op_index)`` of ``name``, or
+        ``None``. """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT block_num, op_index FROM %s WHERE name=?' %
+                self.__tablename__, (name,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def save(self, name, block_num, op_index):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO %s (name, block_num, op_index, '
+                'updated) VALUES (?, ?, ?, ?)' % self.__tablename__,
+                (name, block_num, op_index, time.time()))
+            self._connection.commit()
+
+    def delete(self, name):
+        with self._lock:
+            self._connection.execute(
+                'DELETE FROM %s WHERE name=?' % self.__tablename__, (name,))
+            self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+class FileCheckpointStore(object):
+    """ Stream positions kept in a JSON file.
+
+    The file is replaced atomically on every ``save``: the new content is
+    written to a temporary file, flushed to disk and renamed over the old
+    one, so a crash leaves either the old or the new positions.
+
+    Args:
+        path (str): The JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._positions = json.load(f)
+        except (IOError, OSError):
+            self._positions = {}
+
+    def load(self, name):
+        with self._lock:
+            position = self._positions.get(name)
+        return tuple(position) if position is not None else None
+
+    def save(self, name, block_num, op_index):
+        with self._lock:
+            self._positions[name] = [block_num, op_index]
+            self._write()
+
+    def delete(self, name):
+        with self._lock:
+            self._positions.pop(name, None)
+            self._write()
+
+    def _write(self):
+        # called with self._lock held
+        tmp = '%s.tmp' % self.path
+        with open(tmp, 'w') as f:
+            json.dump(self._positions, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path)
+        if hasattr(os, 'O_DIRECTORY'):
+            # make the rename itself durable
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)),
+                         os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        pass
+
+
+class Checkpoint(object):
+    """ Position of a consumer in the operation stream, for
+    :meth:`beowulf.blockchain.Blockchain.stream` and ``history``.
+
+    An operation counts as processed once the consumer asks for the next
+    one, or calls ``ack()`` (before leaving the loop, for instance). The
+    position of the last processed operation is written to
+    ``store`` after ``commit_every`` operations or ``commit_interval``
+    seconds, whichever comes first, and when the stream is closed. A
+    resumed stream starts right after the saved position, so no
+    operation is delivered twice; operations processed after the last
+    write are delivered again after a crash. ``commit_every=1`` writes
+    after every operation.
+
+    Args:
+        store: A :class:`SqliteCheckpointStore` or
+            :class:`FileCheckpointStore`.
+        name (str): Name of the consumer, so that several can share a
+            store.
+        commit_every (int): Processed operations between writes.
+        commit_interval (float): Seconds between writes.
+
+    .. code-block:: python
+
+       from beowulf.checkpoint import Checkpoint, SqliteCheckpointStore
+
+       checkpoint = Checkpoint(SqliteCheckpointStore(), 'indexer')
+       for op in Blockchain().history(checkpoint=checkpoint):
+           index(op)
+           if stopping:
+               checkpoint.ack()
+               break
+
+    """
+
+    def __init__(self, store, name='default', commit_every=100,
+                 commit_interval=1.0):
+        self.store = store
+        self.name = name
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        #: last saved ``(block_num, op_index)``, ``None`` if none
+        self.committed = store.load(name)
+        #: last processed ``(block_num, op_index)``
+        self.position = self.committed
+        #: last ``(block_num, op_index)`` given to the consumer
+        self.delivered = None
+        self._pending = 0
+        self._last_commit = time.time()
+
+    def done(self, block_num, op_index):
+        """ Record that operation ``op_index`` of block ``block_num`` and
+        everything before it have been processed. """
+        self.position = (block_num, op_index)
+        self._pending += 1
+        if self._pending >= self.commit_every or \
+                time.time() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def ack(self):
+        """ Record that the last delivered operation has been processed.
+        """
+        if self.delivered is not None and self.delivered != self.position:
+            self.done(*self.delivered)
+
+    def commit(self):
+        """ Write the position now. """
+        if self.position is not None and self.position != self.committed:
+            self.store.save(self.name, *self.position)
+            self.committed = self.position
+            logger.debug('Checkpoint %s at block %s, op %s', self.name,
+                         *self.position)
+        self._pending = 0
+        self._last_commit = time.time()
+
+    def reset(self):
+        """ Forget the position, so that the next stream starts over. """
+        self.store.delete(self.name)
+        self.committed = self.position = None
+        self._pending = 0
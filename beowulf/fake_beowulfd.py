@@ -0,0 +1,683 @@
+# coding=utf-8
+""" A stand-in beowulfd JSON-RPC server for benchmarks and load tests.
+
+It serves the ``database_api`` and ``condenser_api`` methods used by
+:class:`beowulf.beowulfd.Beowulfd` from a synthetic chain: blocks,
+operations, accounts and tokens are derived from the block number or
+account name and a seed, so two servers with the same seed serve the same
+data. A new block is produced every ``block_interval`` seconds.
+
+Latency, HTTP errors, dropped connections, overload and the recoverable
+errors of :meth:`beowulfbase.http_client.HttpClient._is_error_recoverable`
+can be injected.
+
+.. code-block:: python
+
+   from beowulf.beowulfd import Beowulfd
+   from beowulf.fake_beowulfd import FakeBeowulfd
+
+   with FakeBeowulfd(latency=0.02, error_rate=0.01) as node:
+       s = Beowulfd([node.url])
+       s.get_block(1000)
+
+or from a shell::
+
+    python -m beowulf.fake_beowulfd --port 8090 --latency 0.02
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from beowulfbase.account import PasswordKey
+from beowulfbase.chains import known_chains
+
+logger = logging.getLogger(__name__)
+
+time_format = '%Y-%m-%dT%H:%M:%S'
+
+#: errors returned by error injection, as beowulfd and jussi send them
+recoverable_errors = {
+    'lock': {'code': -32003, 'message': 'Unable to acquire database lock'},
+    'unknown': {'code': -32000, 'message': 'Unknown exception',
+                'data': '0 exception: unspecified\nUnknown Exception\n'},
+    'internal': {'code': -32603, 'message': 'Internal Error',
+                 'data': {'error_id': 'fake'}},
+    'upstream': {'code': 1100, 'message': 'Bad or missing upstream response',
+                 'data': {'error_id': 'fake', 'exception': 'TimeoutError()'}},
+}
+
+
+def _hex(*parts):
+    return hashlib.sha256(':'.join(str(p) for p in parts).encode()) \
+        .hexdigest()
+
+
+class FakeChain(object):
+    """ Deterministic synthetic chain data.
+
+    Args:
+        seed (int): Seed of all generated data.
+        head_block_number (int): Head block when the chain is created.
+        block_interval (int): Seconds between blocks. Blocks are produced
+            in real time unless ``live`` is ``False``.
+        irreversible_lag (int): Blocks between head and last irreversible
+            block.
+        accounts (int): Number of accounts, named ``user-0000``, ...
+        transactions_per_block (int): Maximum transactions per block.
+        tokens (int): Number of tokens, named ``TOKENA``, ...
+        live (bool): Produce new blocks as time passes.
+        testnet (bool): Report the testnet chain in ``get_config``.
+    """
+
+    def __init__(self, seed=0, head_block_number=1000000, block_interval=3,
+                 irreversible_lag=15, accounts=1000,
+                 transactions_per_block=10, tokens=10, live=True,
+                 testnet=False):
+        self.seed = seed
+        self.block_interval = block_interval
+        self.irreversible_lag = irreversible_lag
+        self.accounts = accounts
+        self.transactions_per_block = transactions_per_block
+        self.tokens = ['TOKEN' + chr(ord('A') + i % 26) * (1 + i // 26)
+                       for i in range(tokens)]
+        self.live = live
+        self.testnet = testnet
+        self.genesis = int(time.time()) - head_block_number * block_interval
+        self._head_block_number = head_block_number
+        self._keys = {}
+
+    # chain state
+
+    @property
+    def head_block_number(self):
+        if not self.live:
+            return self._head_block_number
+        return int((time.time() - self.genesis) // self.block_interval)
+
+    @property
+    def last_irreversible_block_num(self):
+        return max(0, self.head_block_number - self.irreversible_lag)
+
+    def block_time(self, block_num):
+        return datetime.utcfromtimestamp(
+            self.genesis + block_num * self.block_interval) \
+            .strftime(time_format)
+
+    def block_id(self, block_num):
+        return '%08x' % block_num + _hex(self.seed, 'block', block_num)[:32]
+
+    def trx_id(self, block_num, trx_in_block):
+        # the transaction position can be read back from its id
+        return '%08x%04x' % (block_num, trx_in_block) + \
+            _hex(self.seed, 'trx', block_num, trx_in_block)[:28]
+
+    def _rng(self, *parts):
+        return random.Random(_hex(self.seed, *parts))
+
+    # accounts and tokens
+
+    def account_name(self, index):
+        return 'user-%04d' % index
+
+    def supernode(self, block_num):
+        return self.account_name(block_num % min(21, self.accounts))
+
+    def private_key(self, name):
+        """ WIF of the owner key of account ``name``, to sign with. """
+        return self._key(name)[0]
+
+    def public_key(self, name):
+        return self._key(name)[1]
+
+    def _key(self, name):
+        key = self._keys.get(name)
+        if key is None:
+            private = PasswordKey(
+                name, 'fake-beowulfd-%s' % self.seed, 'owner').get_private()
+            key = (str(private), format(private.pubkey, 'BEO'))
+            self._keys[name] = key
+        return key
+
+    def _account_index(self, name):
+        try:
+            prefix, index = name.split('-')
+            index = int(index)
+        except (AttributeError, ValueError):
+            return None
+        if prefix != 'user' or not 0 <= index < self.accounts or \
+                name != self.account_name(index):
+            return None
+        return index
+
+    def account(self, name):
+        index = self._account_index(name)
+        if index is None:
+            return None
+        rng = self._rng('account', name)
+        pubkey = self.public_key(name)
+        return {
+            'id': index,
+            'name': name,
+            'owner': {'weight_threshold': 1, 'account_auths': [],
+                      'key_auths': [[pubkey, 1]]},
+            'json_metadata': '{}',
+            'last_owner_update': self.block_time(0),
+            'created': self.block_time(index),
+            'balance': '%.5f BWF' % (rng.randint(0, 10 ** 9) / 1e5),
+            'wd_balance': '%.5f W' % (rng.randint(0, 10 ** 8) / 1e5),
+            'vesting_shares': '%.5f M' % (rng.randint(0, 10 ** 9) / 1e5),
+            'vesting_withdraw_rate': '0.00000 M',
+            'supernodes_voted_for': 0,
+            'token_list': [],
+        }
+
+    def token(self, name):
+        if name not in self.tokens:
+            return None
+        return {
+            'liquid_symbol': {'name': name, 'decimals': 5},
+            'control_account': self.account_name(
+                self.tokens.index(name) % self.accounts),
+            'phase': 'launch_success',
+            'current_supply': 10 ** 12,
+        }
+
+    # blocks and operations
+
+    def _transactions(self, block_num):
+        rng = self._rng('txs', block_num)
+        transactions = []
+        for trx_in_block in range(rng.randint(0, self.transactions_per_block)):
+            sender = self.account_name(rng.randrange(self.accounts))
+            receiver = self.account_name(rng.randrange(self.accounts))
+            if rng.random() < 0.2 and self.tokens:
+                asset = rng.choice(self.tokens)
+            else:
+                asset = 'BWF'
+            transactions.append({
+                'ref_block_num': (block_num - 3) & 0xFFFF,
+                'ref_block_prefix': rng.getrandbits(32),
+                'expiration': self.block_time(block_num + 20),
+                'operations': [['transfer', {
+                    'from': sender,
+                    'to': receiver,
+                    'amount': '%.5f %s' % (rng.randint(1, 10 ** 7) / 1e5,
+                                           asset),
+                    'fee': '0.01000 W',
+                    'memo': '',
+                }]],
+                'extensions': [],
+                'signatures': ['1f' + _hex(self.seed, 'sig', block_num,
+                                           trx_in_block) * 2],
+            })
+        return transactions
+
+    def block(self, block_num):
+        if not 0 < block_num <= self.head_block_number:
+            return None
+        transactions = self._transactions(block_num)
+        supernode = self.supernode(block_num)
+        return {
+            'previous': self.block_id(block_num - 1),
+            'timestamp': self.block_time(block_num),
+            'supernode': supernode,
+            'transaction_merkle_root': _hex(self.seed, 'merkle',
+                                            block_num)[:40],
+            'extensions': [],
+            'supernode_signature': '1f' + _hex(self.seed, 'bsig',
+                                               block_num) * 2,
+            'transactions': transactions,
+            'block_id': self.block_id(block_num),
+            'signing_key': self.public_key(supernode),
+            'transaction_ids': [self.trx_id(block_num, i)
+                                for i in range(len(transactions))],
+        }
+
+    def block_header(self, block_num):
+        block = self.block(block_num)
+        if block is None:
+            return None
+        return dict((k, block[k]) for k in (
+            'previous', 'timestamp', 'supernode', 'transaction_merkle_root',
+            'extensions'))
+
+    def ops_in_block(self, block_num, virtual_only=False):
+        block = self.block(block_num)
+        if block is None:
+            return []
+        ops = []
+        timestamp = block['timestamp']
+        if not virtual_only:
+            for trx_in_block, tx in enumerate(block['transactions']):
+                for op_in_trx, op in enumerate(tx['operations']):
+                    ops.append({
+                        'trx_id': block['transaction_ids'][trx_in_block],
+                        'block': block_num,
+                        'trx_in_block': trx_in_block,
+                        'op_in_trx': op_in_trx,
+                        'virtual_op': 0,
+                        'timestamp': timestamp,
+                        'op': op,
+                    })
+        ops.append({
+            'trx_id': '0' * 40,
+            'block': block_num,
+            'trx_in_block': len(block['transactions']),
+            'op_in_trx': 0,
+            'virtual_op': 1,
+            'timestamp': timestamp,
+            'op': ['producer_reward', {
+                'producer': block['supernode'],
+                'vesting_shares': '1.00000 M',
+            }],
+        })
+        return ops
+
+    def transaction(self, trx_id):
+        try:
+            block_num, trx_in_block = int(trx_id[:8], 16), int(trx_id[8:12],
+                                                               16)
+        except (TypeError, ValueError):
+            return None
+        block = self.block(block_num)
+        if block is None or trx_in_block >= len(block['transactions']) or \
+                self.trx_id(block_num, trx_in_block) != trx_id:
+            return None
+        tx = dict(block['transactions'][trx_in_block])
+        tx.update(transaction_id=trx_id, block_num=block_num,
+                  transaction_num=trx_in_block)
+        return tx
+
+    def dynamic_global_properties(self):
+        head = self.head_block_number
+        return {
+            'id': 0,
+            'head_block_number': head,
+            'head_block_id': self.block_id(head),
+            'time': self.block_time(head),
+            'current_supernode': self.supernode(head),
+            'current_supply': '1000000000.00000 BWF',
+            'current_wd_supply': '100000000.00000 W',
+            'total_vesting_shares': '1000000000.00000 M',
+            'last_irreversible_block_num': self.last_irreversible_block_num,
+        }
+
+    def config(self):
+        chain = known_chains['TESTNET' if self.testnet else 'MAINNET']
+        return {
+            'IS_TEST_NET': self.testnet,
+            'BWF_CHAIN_ID': chain['chain_id'],
+            'BWF_ADDRESS_PREFIX': chain['prefix'],
+            'BWF_BLOCK_INTERVAL': self.block_interval,
+            'BWF_MAX_BLOCK_SIZE': 393216000,
+        }
+
+    # JSON-RPC methods, called with the list of params
+
+    def rpc_get_config(self):
+        return self.config()
+
+    def rpc_get_dynamic_global_properties(self):
+        return self.dynamic_global_properties()
+
+    def rpc_get_block(self, block_num):
+        return self.block(int(block_num))
+
+    def rpc_get_block_header(self, block_num):
+        return self.block_header(int(block_num))
+
+    def rpc_get_ops_in_block(self, block_num, virtual_only=False):
+        return self.ops_in_block(int(block_num), virtual_only)
+
+    def rpc_get_transaction(self, trx_id):
+        return self.transaction(trx_id)
+
+    def rpc_get_accounts(self, names):
+        return [a for a in (self.account(name) for name in names) if a]
+
+    def rpc_lookup_account_names(self, names):
+        return [self.account(name) for name in names]
+
+    def rpc_lookup_accounts(self, lower_bound, limit):
+        start = self._account_index(lower_bound)
+        if start is None:
+            start = 0 if lower_bound < self.account_name(0) else self.accounts
+        return [self.account_name(i)
+                for i in range(start, min(self.accounts, start + limit))]
+
+    def rpc_get_account_count(self):
+        return self.accounts
+
+    def rpc_get_balance(self, account, token):
+        rng = self._rng('balance', account, token)
+        return '%.5f %s' % (rng.randint(0, 10 ** 9) / 1e5, token)
+
+    def rpc_list_smt_tokens(self):
+        return [self.token(name) for name in self.tokens]
+
+    def rpc_find_smt_tokens_by_name(self, names):
+        if not isinstance(names, list):
+            names = [names]
+        return [t for t in (self.token(name) for name in names) if t]
+
+    def rpc_get_chain_properties(self):
+        return {'account_creation_fee': '1.00000 W',
+                'maximum_block_size': 65536}
+
+    def rpc_get_hardfork_version(self):
+        return '0.0.0'
+
+    def rpc_get_next_scheduled_hardfork(self):
+        return {'hf_version': '0.0.0', 'live_time': self.block_time(0)}
+
+    def rpc_get_version(self):
+        return {'blockchain_version': '0.0.0',
+                'beowulf_revision': 'fake', 'fc_revision': 'fake'}
+
+    def rpc_get_active_supernodes(self):
+        return [self.account_name(i) for i in range(min(21, self.accounts))]
+
+    def rpc_get_supernode_schedule(self):
+        return {'id': 0, 'current_shuffled_supernodes':
+                self.rpc_get_active_supernodes()}
+
+    def rpc_get_supernode_count(self):
+        return min(21, self.accounts)
+
+    def rpc_get_pending_transaction_count(self):
+        return 0
+
+    def rpc_verify_authority(self, trx):
+        return True
+
+    def rpc_get_required_signatures(self, trx, available_keys):
+        return available_keys
+
+    def rpc_get_potential_signatures(self, trx):
+        return []
+
+    def rpc_get_key_references(self, keys):
+        return [[] for _ in keys]
+
+    def rpc_broadcast_transaction(self, trx):
+        return None
+
+    def rpc_broadcast_transaction_synchronous(self, trx):
+        return {'id': _hex(self.seed, json.dumps(trx, sort_keys=True))[:40],
+                'block_num': self.head_block_number + 1, 'trx_num': 0,
+                'expired': False}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'fake-beowulfd'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        if self.connection.family != socket.AF_UNIX:
+            self.connection.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def address_string(self):
+        return str(self.client_address)
+
+    def _send(self, status, body):
+        head = ('HTTP/1.1 %d %s\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: %d\r\n'
+                '\r\n' % (status, self.responses.get(status, ('',))[0],
+                          len(body))).encode('latin-1')
+        # a single write, so that small replies are not delayed by Nagle
+        self.wfile.write(head + body)
+
+    def do_POST(self):
+        node = self.server.node
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with node.enter() as overloaded:
+            node.sleep()
+            fault = node.fault()
+            if fault == 'disconnect':
+                self.close_connection = True
+                return
+            if fault == 'http':
+                self._send(503, b'{"error":"service unavailable"}')
+                return
+            try:
+                request = json.loads(body.decode('utf-8'))
+            except ValueError:
+                self._send(200, json.dumps(node.error(
+                    None, {'code': -32700, 'message': 'Parse error'}))
+                    .encode('utf-8'))
+                return
+            if isinstance(request, list):
+                if not node.batch:
+                    response = node.error(None, {
+                        'code': -32600, 'message': 'Invalid Request'})
+                else:
+                    response = [node.handle(r, fault, overloaded)
+                                for r in request]
+            else:
+                response = node.handle(request, fault, overloaded)
+            self._send(200, json.dumps(response).encode('utf-8'))
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FakeBeowulfd(object):
+    """ Serve a :class:`FakeChain` over HTTP.
+
+    Args:
+        host (str), port (int): Address to listen on; port 0 picks a free
+            port.
+        unix_socket (str): Listen on this Unix socket instead.
+        latency (float): Seconds added to every response.
+        jitter (float): Random extra latency, up to this many seconds.
+        error_rate (float): Share of requests answered with one of
+            ``errors``.
+        errors (list): Keys of ``recoverable_errors`` to inject. Defaults
+            to all of them.
+        http_error_rate (float): Share of requests answered with a 503.
+        disconnect_rate (float): Share of requests whose connection is
+            closed without a response.
+        max_concurrency (int): Above this many concurrent requests, answer
+            with "Unable to acquire database lock", like an overloaded
+            beowulfd.
+        batch (bool): Accept JSON-RPC batches.
+        seed (int): Seed of the chain data and of the injected faults.
+        chain (FakeChain): The chain to serve; other chain kwargs are
+            passed to :class:`FakeChain` when it is not given.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, unix_socket=None,
+                 latency=0, jitter=0, error_rate=0, errors=None,
+                 http_error_rate=0, disconnect_rate=0, max_concurrency=None,
+                 batch=True, seed=0, chain=None, **chain_kwargs):
+        self.chain = chain or FakeChain(seed=seed, **chain_kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = list(errors or sorted(recoverable_errors))
+        self.http_error_rate = http_error_rate
+        self.disconnect_rate = disconnect_rate
+        self.max_concurrency = max_concurrency
+        self.batch = batch
+        self.requests = 0
+        self._in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            self.server = _UnixServer(unix_socket, _Handler)
+            self.url = 'unix://' + unix_socket
+        else:
+            self.server = _TCPServer((host, port), _Handler)
+            self.url = 'http://%s:%d/' % self.server.server_address[:2]
+        self.server.node = self
+        self._thread = None
+
+    # fault injection
+
+    def _chance(self, rate):
+        # called with self._lock held
+        return rate > 0 and self._rng.random() < rate
+
+    def fault(self):
+        """ Draw the transport fault of a request, if any. """
+        with self._lock:
+            self.requests += 1
+            if self._chance(self.disconnect_rate):
+                return 'disconnect'
+            if self._chance(self.http_error_rate):
+                return 'http'
+            if self._chance(self.error_rate):
+                return self._rng.choice(self.errors)
+        return None
+
+    def enter(self):
+        return _InFlight(self)
+
+    def sleep(self):
+        with self._lock:
+            delay = self.latency + (self._rng.random() * self.jitter
+                                    if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    @staticmethod
+    def error(_id, error):
+        return {'jsonrpc': '2.0', 'id': _id, 'error': error}
+
+    def handle(self, request, fault=None, overloaded=False):
+        """ Answer one JSON-RPC request object. """
+        _id = request.get('id') if isinstance(request, dict) else None
+        if overloaded:
+            return self.error(_id, recoverable_errors['lock'])
+        if fault in recoverable_errors:
+            return self.error(_id, recoverable_errors[fault])
+        try:
+            method, params = request['method'], request.get('params', [])
+            if method == 'call':
+                api, method, params = params
+            elif '.' in method:
+                api, method = method.split('.', 1)
+            if isinstance(params, dict):
+                params = list(params.values())
+            handler = getattr(self.chain, 'rpc_' + method, None)
+            if handler is None:
+                return self.error(_id, {
+                    'code': -32601,
+                    'message': 'Could not find method %s' % method})
+            return {'jsonrpc': '2.0', 'id': _id, 'result': handler(*params)}
+        except Exception as e:
+            return self.error(_id, {
+                'code': -32602, 'message': 'Invalid params',
+                'data': '%s: %s' % (e.__class__.__name__, e)})
+
+    # server lifecycle
+
+    def start(self):
+        """ Serve in a background thread. Returns ``self``. """
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='fake-beowulfd')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.url.startswith('unix://'):
+            try:
+                os.unlink(self.url[len('unix://'):])
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _InFlight(object):
+    """ Count a request as in flight; the context value tells whether
+    the node is over ``max_concurrency``. """
+
+    def __init__(self, node):
+        self.node = node
+
+    def __enter__(self):
+        node = self.node
+        with node._lock:
+            node._in_flight += 1
+            return node.max_concurrency is not None and \
+                node._in_flight > node.max_concurrency
+
+    def __exit__(self, *exc):
+        with self.node._lock:
+            self.node._in_flight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve a synthetic beowulf chain over JSON-RPC.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--unix-socket')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--head', type=int, default=1000000,
+                        help='head block number at start')
+    parser.add_argument('--block-interval', type=int, default=3)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--errors', nargs='*',
+                        choices=sorted(recoverable_errors))
+    parser.add_argument('--http-error-rate', type=float, default=0)
+    parser.add_argument('--disconnect-rate', type=float, default=0)
+    parser.add_argument('--max-concurrency', type=int)
+    parser.add_argument('--no-batch', action='store_true')
+    args = parser.parse_args()
+
+    node = FakeBeowulfd(
+        host=args.host, port=args.port, unix_socket=args.unix_socket,
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, errors=args.errors,
+        http_error_rate=args.http_error_rate,
+        disconnect_rate=args.disconnect_rate,
+        max_concurrency=args.max_concurrency, batch=not args.no_batch,
+        seed=args.seed, head_block_number=args.head,
+        block_interval=args.block_interval, accounts=args.accounts)
+    print('Serving fake beowulfd on %s' % node.url)
+    try:
+        node.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.stop()
+
+
+if __name__ == '__main__':
+    main()
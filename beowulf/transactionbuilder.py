@@ -1,6 +1,7 @@
 import logging
 from beowulfbase import operations
 from beowulfbase.account import PrivateKey
+from beowulfbase.concurrency import HIGH
 from beowulfbase.exceptions import (InsufficientAuthorityError, MissingKeyError,
                                     InvalidKeyFormat)
 from beowulfbase.operations import Operation
@@ -91,7 +92,10 @@ class TransactionBuilder(dict):
         else:
             ops = [Operation(self.op)]
         expiration = fmt_time_from_now(self.expiration)
-        ref_block_num, ref_block_prefix = get_block_params(self.beowulfd)
+        # the reference block is read right before broadcasting, so it
+        # must not wait behind bulk reads of the same client
+        with self.beowulfd.priority(HIGH):
+            ref_block_num, ref_block_prefix = get_block_params(self.beowulfd)
         created_time = fmt_time_from_now_to_epoch()
         tx = SignedTransaction(
             ref_block_num=ref_block_num,
@@ -114,8 +118,10 @@ class TransactionBuilder(dict):
 
         # We need to set the default prefix, otherwise pubkeys are
         # presented wrongly!
+        chain_params = self.get("blockchain")
         if self.beowulfd:
-            operations.default_prefix = self.beowulfd.chain_params["prefix"]
+            chain_params = self.beowulfd.chain_params
+            operations.default_prefix = chain_params["prefix"]
         elif "blockchain" in self:
             operations.default_prefix = self["blockchain"]["prefix"]
 
@@ -128,7 +134,7 @@ class TransactionBuilder(dict):
         if not any(self.wifs):
             raise MissingKeyError
 
-        signedtx.sign(self.wifs, chain=self.beowulfd.chain_params)
+        signedtx.sign(self.wifs, chain=chain_params)
 
         self["signatures"].extend(signedtx.json().get("signatures"))
 
@@ -1,14 +1,23 @@
 __all__ = [
     'account',
+    'async_http_client',
     'base58',
     'bip38',
+    'capabilities',
     'chains',
+    'concurrency',
     'exceptions',
     'http_client',
+    'json_codec',
+    'metrics',
+    'node_pool',
     'operationids',
     'operations',
+    'retry',
+    'single_flight',
     'storage',
     'transactions',
+    'transports',
     'types',
     # 'memo',
 ]
@@ -0,0 +1,286 @@
+# coding=utf-8
+import asyncio
+import logging
+import ssl
+from itertools import cycle
+from urllib.parse import urlparse
+
+import certifi
+from beowulfbase.exceptions import RPCErrorRecoverable
+from beowulfbase.http_client import HttpClient
+from beowulfbase.json_codec import get_codec
+from beowulfbase.retry import backoff_delay
+from beowulfbase.transports import parse_unix_url, unix_schemes
+
+logger = logging.getLogger(__name__)
+
+
+class _AsyncHostPool(object):
+    """ Keep-alive HTTP/1.1 connections to a single node.
+
+    At most ``maxsize`` connections are open at once; additional requests
+    wait for a connection to be released.
+    """
+
+    def __init__(self, url, maxsize, ssl_context):
+        parsed = urlparse(url)
+        self.socket_path = None
+        if parsed.scheme in unix_schemes:
+            self.socket_path, self.path = parse_unix_url(url)
+            self.host = 'localhost'
+        else:
+            self.host = parsed.hostname
+            self.path = parsed.path or '/'
+            if parsed.query:
+                self.path += '?' + parsed.query
+        self.secure = parsed.scheme == 'https'
+        self.port = parsed.port or (443 if self.secure else 80)
+        self.ssl = ssl_context if self.secure else None
+        self.maxsize = maxsize
+        self._idle = []
+        self._semaphore = None
+
+    async def _connect(self):
+        if self.socket_path is not None:
+            return await asyncio.open_unix_connection(self.socket_path)
+        return await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl)
+
+    def _request_head(self, body):
+        return ('POST %s HTTP/1.1\r\n'
+                'Host: %s\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: %d\r\n'
+                'Connection: keep-alive\r\n'
+                '\r\n' % (self.path, self.host, len(body))).encode('latin-1')
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by node')
+        status = int(status_line.split(None, 2)[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # skip trailers
+                    line = await reader.readline()
+                    while line not in (b'\r\n', b'\n', b''):
+                        line = await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        else:
+            data = await reader.read()
+            keep_alive = False
+
+        return status, data, keep_alive
+
+    async def request(self, body, timeout):
+        """ POST ``body`` and return ``(status, data)``. """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxsize)
+
+        async with self._semaphore:
+            # a pooled connection may have been closed by the node while it
+            # was idle; in that case try once more on a fresh connection.
+            while True:
+                reused = bool(self._idle)
+                if reused:
+                    reader, writer = self._idle.pop()
+                else:
+                    reader, writer = await asyncio.wait_for(
+                        self._connect(), timeout)
+                try:
+                    writer.write(self._request_head(body) + body)
+                    await writer.drain()
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self._read_response(reader), timeout)
+                except (OSError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+
+                if keep_alive:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, data
+
+    def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class AsyncHttpClient(object):
+    """ Asyncio Beowulf JSON-HTTP-RPC API
+
+    This is the coroutine counterpart of
+    :class:`beowulfbase.http_client.HttpClient`. It applies the same node
+    fail-over and recoverable error handling, but never blocks the event
+    loop, so a single loop can keep many requests in flight.
+
+    Args:
+      nodes (list): A list of Beowulf HTTP RPC nodes to connect to.
+
+    .. code-block:: python
+
+       from beowulfbase.async_http_client import AsyncHttpClient
+
+       rpc = AsyncHttpClient(['https://beowulfd-node1.com',
+       'https://beowulfd-node2.com'])
+
+       block = await rpc.call('get_block', 1, api='database_api')
+
+    """
+
+    json_rpc_body = staticmethod(HttpClient.json_rpc_body)
+    sanitize_nodes = HttpClient.sanitize_nodes
+    _isString = HttpClient._isString
+    _is_error_recoverable = HttpClient._is_error_recoverable
+    _raise_for_error = HttpClient._raise_for_error
+    _raise_for_node_error = HttpClient._raise_for_node_error
+    _encode_request = HttpClient._encode_request
+    _node_downgraded = HttpClient._node_downgraded
+    _downgrade_node = HttpClient._downgrade_node
+    # capabilities are not persisted by the async client
+    capability_store = None
+
+    def __init__(self, nodes, **kwargs):
+        # set of endpoints which were detected to not support condenser_api
+        self.non_appbase_nodes = set()
+
+        self.maxsize = kwargs.get('maxsize', 100)
+        self.timeout = kwargs.get('timeout', 60)
+        self.max_tries = kwargs.get('max_tries', 10)
+        self.backoff_base = kwargs.get('backoff_base', 0.5)
+        self.backoff_max = kwargs.get('backoff_max', 10)
+        self.codec = get_codec(kwargs.get('json_codec', None))
+
+        self._ssl_context = None
+        self.pools = {}
+
+        self.nodes = cycle(self.sanitize_nodes(nodes))
+        self.url = ''
+        self.next_node()
+
+        log_level = kwargs.get('log_level', logging.INFO)
+        logger.setLevel(log_level)
+
+    def next_node(self):
+        """ Switch to the next available node. """
+        self.set_node(next(self.nodes))
+
+    def set_node(self, node_url):
+        """ Change current node to provided node URL. """
+        self.url = node_url
+
+    @property
+    def hostname(self):
+        return urlparse(self.url).hostname
+
+    @property
+    def ssl_context(self):
+        # certificates are only loaded once an https node is used
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context(
+                cafile=certifi.where())
+        return self._ssl_context
+
+    def _pool(self, url):
+        pool = self.pools.get(url)
+        if pool is None:
+            secure = urlparse(url).scheme == 'https'
+            pool = _AsyncHostPool(url, self.maxsize,
+                                  self.ssl_context if secure else None)
+            self.pools[url] = pool
+        return pool
+
+    async def call(self, name, *args, **kwargs):
+        """ Call a remote procedure in beowulfd.
+
+        Warnings:
+
+            This coroutine will auto-retry in case of node failure, as well
+            as handle node fail-over.
+
+        """
+
+        # tuple of Exceptions which are eligible for retry
+        retry_exceptions = (OSError, ValueError, asyncio.TimeoutError,
+                            asyncio.IncompleteReadError, RPCErrorRecoverable)
+
+        tries = 0
+        while True:
+            url = self.url
+            try:
+                body = self._encode_request(url, name, args, kwargs)
+                status, data = await self._pool(url).request(
+                    body, self.timeout)
+                if status != 200 and not 300 <= status < 400:
+                    raise RuntimeError("non-200 response: %s from %s" %
+                                       (status, urlparse(url).hostname))
+
+                result = self.codec.loads(data)
+                assert result, 'result entirely blank'
+
+                self._raise_for_node_error(url, result)
+                return result['result']
+
+            except retry_exceptions as e:
+                if tries >= self.max_tries:
+                    logger.error('Failed after %d attempts -- %s: %s',
+                                 tries, e.__class__.__name__, e)
+                    raise e
+                tries += 1
+                delay = backoff_delay(tries, self.backoff_base,
+                                      self.backoff_max)
+                logger.warning('Retry in %.2fs -- %s: %s', delay,
+                               e.__class__.__name__, e)
+                await asyncio.sleep(delay)
+                # another coroutine may have failed over already
+                if self.url == url:
+                    self.next_node()
+                continue
+
+    async def call_multi(self, name, params, api=None):
+        """ Run ``call`` once per entry of ``params`` concurrently and
+        return the results in the order of ``params``. """
+
+        def ensure_list(val):
+            return val if isinstance(val, (list, tuple, set)) else [val]
+
+        return await asyncio.gather(
+            *[self.call(name, *ensure_list(param), api=api)
+              for param in params])
+
+    def close(self):
+        """ Close all idle keep-alive connections. """
+        for pool in self.pools.values():
+            pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
@@ -0,0 +1,99 @@
+# coding=utf-8
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from appdirs import user_data_dir
+
+
+class CapabilityStore(object):
+    """ Capabilities of nodes, as found by
+    :meth:`beowulfbase.http_client.HttpClient.probe_capabilities`, kept on
+    disk so that new processes route their first request correctly.
+
+    An entry is a dictionary with:
+
+    - ``condenser_api`` (bool): the node serves ``condenser_api``.
+    - ``batch`` (bool): the node accepts JSON-RPC batches.
+    - ``version`` (dict): result of ``get_version``, or ``None``.
+    - ``chain_id`` (str): chain id from ``get_config``, or ``None``.
+    - ``testnet`` (bool): ``IS_TEST_NET`` from ``get_config``, or ``None``.
+    - ``probed_at`` (float): time of the probe.
+
+    Entries older than ``ttl`` seconds are ignored, so that upgraded
+    nodes are probed again.
+
+    Args:
+        path (str): Database file. Defaults to ``node_capabilities.sqlite``
+            in the beowulf user data directory; ``':memory:'`` keeps the
+            entries in this process only.
+        ttl (float): Seconds an entry stays valid. Defaults to a day.
+    """
+    __tablename__ = 'node_capabilities'
+
+    def __init__(self, path=None, ttl=86400):
+        if path is None:
+            data_dir = user_data_dir("BWF", "BeowulfTeam")
+            if not os.path.isdir(data_dir):
+                os.makedirs(data_dir)
+            path = os.path.join(data_dir, 'node_capabilities.sqlite')
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           timeout=5)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'url TEXT PRIMARY KEY, value TEXT, probed_at REAL)' %
+            self.__tablename__)
+        # drop entries of nodes which are not used anymore
+        self._connection.execute(
+            'DELETE FROM %s WHERE probed_at < ?' % self.__tablename__,
+            (time.time() - self.ttl,))
+        self._connection.commit()
+
+    def get(self, url):
+        """ Return the capabilities of ``url``, or ``None`` if they are
+        unknown or expired. """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, probed_at FROM %s WHERE url=?' %
+                self.__tablename__, (url,)).fetchone()
+        if row is None or row[1] + self.ttl < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, url, capabilities):
+        """ Store the capabilities of ``url``. """
+        capabilities = dict(capabilities)
+        capabilities.setdefault('probed_at', time.time())
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO %s (url, value, probed_at) '
+                'VALUES (?, ?, ?)' % self.__tablename__,
+                (url, json.dumps(capabilities), capabilities['probed_at']))
+            self._connection.commit()
+
+    def update(self, url, **changes):
+        """ Change some capabilities of ``url``, if it is known. Used when
+        a request finds out that a node lost a capability. """
+        capabilities = self.get(url)
+        if capabilities is not None:
+            capabilities.update(changes)
+            self.set(url, capabilities)
+
+    def delete(self, url):
+        with self._lock:
+            self._connection.execute(
+                'DELETE FROM %s WHERE url=?' % self.__tablename__, (url,))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM %s' % self.__tablename__)
+            self._connection.commit()
+
+    def close(self):
+        self._connection.close()
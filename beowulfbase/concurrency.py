@@ -0,0 +1,177 @@
+# coding=utf-8
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#: request priorities, most urgent first
+HIGH, NORMAL, BULK = 0, 1, 2
+
+
+class _NodeLimit(object):
+    __slots__ = ('limit', 'in_flight', 'waiting', 'baseline', 'latency',
+                 'last_cut')
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.waiting = [0, 0, 0]
+        self.baseline = None
+        self.latency = None
+        self.last_cut = 0.0
+
+
+class AdaptiveLimiter(object):
+    """ Limit the number of requests in flight to each node, adapting the
+    limit with AIMD (additive increase, multiplicative decrease).
+
+    While responses come back within ``tolerance`` times the node's
+    baseline latency and the limit is actually used, the limit grows by
+    about one per round trip. An overload signal (a timeout or a "database
+    lock" error) cuts it by ``backoff``, at most once per round trip so
+    that one burst of failures counts once.
+
+    The baseline is the lowest latency seen, drifting slowly up so that it
+    follows a node whose normal latency changes.
+
+    One limiter is shared by every request of a client (bulk fetchers,
+    streams, single calls), and may be shared between clients as well.
+
+    Requests have a priority: ``HIGH``, ``NORMAL`` or ``BULK``. A free
+    slot always goes to the most urgent waiting request, and ``reserved``
+    slots above the limit are kept for ``HIGH`` requests only, so that
+    broadcasts never wait behind bulk reads.
+
+    Args:
+        initial_limit (int): Limit of a node before any response.
+        min_limit (int): The limit never goes below this.
+        max_limit (int): The limit never goes above this.
+        backoff (float): Factor applied to the limit on overload.
+        tolerance (float): Latency, relative to the baseline, up to which
+            the node is considered healthy enough to grow the limit.
+        reserved (int): Extra slots per node for ``HIGH`` requests.
+
+    .. code-block:: python
+
+       limiter = AdaptiveLimiter()
+       limiter.acquire(url)
+       try:
+           response = send(url)
+       finally:
+           limiter.release(url, latency, overloaded)
+
+    """
+
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=32,
+                 backoff=0.5, tolerance=2.0, reserved=2):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.reserved = reserved
+        self._nodes = {}
+        self._cond = threading.Condition()
+
+    def _node(self, url):
+        # called with self._cond held
+        node = self._nodes.get(url)
+        if node is None:
+            node = _NodeLimit(min(self.initial_limit, self.max_limit))
+            self._nodes[url] = node
+        return node
+
+    def limit(self, url):
+        """ Current number of requests allowed in flight to ``url``. """
+        with self._cond:
+            return int(self._node(url).limit)
+
+    def _may_start(self, node, priority):
+        # called with self._cond held
+        if priority == HIGH:
+            return node.in_flight < int(node.limit) + self.reserved
+        if node.in_flight >= int(node.limit):
+            return False
+        return not any(node.waiting[:priority])
+
+    def acquire(self, url, priority=NORMAL, timeout=None):
+        """ Wait until a request to ``url`` may be sent, and count it as
+        in flight. Every successful call must be followed by ``release``.
+
+        Args:
+            url (str): The node.
+            priority (int): ``HIGH``, ``NORMAL`` or ``BULK``.
+            timeout (float): Seconds to wait at most, ``None`` for no
+                limit.
+
+        Returns:
+            bool: ``False`` if ``timeout`` passed first; the request is
+            then not counted.
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._cond:
+            node = self._node(url)
+            if not self._may_start(node, priority):
+                node.waiting[priority] += 1
+                try:
+                    while not self._may_start(node, priority):
+                        if end is None:
+                            self._cond.wait()
+                            continue
+                        remaining = end - time.time()
+                        if remaining <= 0:
+                            # lower lanes may have been waiting for us
+                            self._cond.notify_all()
+                            return False
+                        self._cond.wait(remaining)
+                finally:
+                    node.waiting[priority] -= 1
+            node.in_flight += 1
+        return True
+
+    def release(self, url, latency=None, overloaded=False):
+        """ Record the end of a request to ``url``.
+
+        Args:
+            url (str): The node.
+            latency (float): Duration of a successful request, ``None``
+                if it failed.
+            overloaded (bool): ``True`` if the request failed in a way
+                that indicates the node is overloaded.
+        """
+        now = time.time()
+        with self._cond:
+            node = self._node(url)
+            used = node.in_flight * 2 >= node.limit
+            node.in_flight -= 1
+            if overloaded:
+                if now - node.last_cut >= (node.latency or 0):
+                    limit = max(self.min_limit, node.limit * self.backoff)
+                    if int(limit) < int(node.limit):
+                        logger.info('Concurrency limit of %s lowered to %d',
+                                    url, limit)
+                    node.limit = limit
+                    node.last_cut = now
+            elif latency is not None:
+                if node.baseline is None or latency < node.baseline:
+                    node.baseline = latency
+                else:
+                    node.baseline += 0.01 * (latency - node.baseline)
+                if node.latency is None:
+                    node.latency = latency
+                else:
+                    node.latency += 0.2 * (latency - node.latency)
+                if used and latency <= node.baseline * self.tolerance:
+                    node.limit = min(self.max_limit,
+                                     node.limit + 1.0 / node.limit)
+            self._cond.notify_all()
+
+    def stats(self):
+        """ Return a list with the limit and load of each node. """
+        with self._cond:
+            return [{'url': url, 'limit': int(node.limit),
+                     'in_flight': node.in_flight,
+                     'waiting': sum(node.waiting), 'latency': node.latency,
+                     'baseline': node.baseline}
+                    for url, node in sorted(self._nodes.items())]
@@ -2,17 +2,28 @@
 import json
 import logging
 import socket
+import sqlite3
 import time
 import sys
+import threading
+from collections import deque
 from functools import partial
-from itertools import cycle
 import concurrent.futures
+from contextlib import contextmanager
 from typing import Optional, Any
 import certifi
 import urllib3
+from beowulfbase.capabilities import CapabilityStore
+from beowulfbase.concurrency import AdaptiveLimiter, HIGH, NORMAL
 from beowulfbase.exceptions import RPCError, RPCErrorRecoverable
+from beowulfbase.json_codec import get_codec, iter_result
+from beowulfbase.node_pool import NodePool
+from beowulfbase.retry import RetryBudget, backoff_delay
+from beowulfbase.single_flight import SingleFlight, WaitTimeout
+from beowulfbase.transports import TLSSessionContext, get_transport
 from urllib3.connection import HTTPConnection
-from urllib3.exceptions import MaxRetryError, ReadTimeoutError, ProtocolError
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError, \
+    ProtocolError, ConnectTimeoutError, NewConnectionError
 
 if sys.version >= '3.5':
     from http.client import RemoteDisconnected
@@ -25,6 +36,70 @@ else:
 
 logger = logging.getLogger(__name__)
 
+# marks an empty result in _stream_node
+_no_item = object()
+
+# tuple of Exceptions which are eligible for retry
+retry_exceptions = (MaxRetryError, ReadTimeoutError,
+                    ProtocolError, RPCErrorRecoverable,)
+
+if sys.version > '3.5':
+    retry_exceptions += (json.decoder.JSONDecodeError, RemoteDisconnected,)
+else:
+    retry_exceptions += (ValueError,)
+
+if sys.version > '3.0':
+    retry_exceptions += (ConnectionResetError,)
+else:
+    retry_exceptions += (HTTPException,)
+
+# recoverable errors which beowulfd or jussi return when they are overloaded
+overload_messages = frozenset([
+    'Unable to acquire database lock',
+    'Bad or missing upstream response',
+])
+
+# idempotent reads, which may be hedged to a second node and coalesced
+# with identical concurrent calls
+idempotent_methods = frozenset([
+    'get_account_count',
+    'get_accounts',
+    'get_active_supernodes',
+    'get_balance',
+    'get_block',
+    'get_block_header',
+    'get_chain_properties',
+    'get_config',
+    'get_dynamic_global_properties',
+    'get_hardfork_version',
+    'get_ops_in_block',
+    'get_supernode_schedule',
+    'get_transaction',
+    'get_version',
+    'lookup_account_names',
+    'lookup_accounts',
+])
+
+# broadcasts and the reads a transaction needs right before its broadcast
+# (TAPOS reference block, required signatures), which are sent in the
+# limiter's HIGH lane
+high_priority_methods = frozenset([
+    'broadcast_block',
+    'broadcast_transaction',
+    'broadcast_transaction_synchronous',
+    'get_dynamic_global_properties',
+    'get_potential_signatures',
+    'get_required_signatures',
+    'get_transaction_hex',
+    'verify_authority',
+])
+
+
+class DeadlineExceeded(ReadTimeoutError):
+    """ The deadline of a call passed before its request was sent, while
+    waiting for a limiter slot for instance. Unlike the other timeouts,
+    it says nothing about the health of the node. """
+
 
 class HttpClient(object):
     """ Simple Beowulf JSON-HTTP-RPC API
@@ -33,6 +108,71 @@ class HttpClient(object):
 
     Args:
       nodes (list): A list of Beowulf HTTP RPC nodes to connect to.
+      failure_threshold (int): Consecutive failures after which a node is
+        taken out of rotation (its circuit opens). Defaults to 3.
+      reset_timeout (float): Seconds between health probes of a node
+        whose circuit is open. Defaults to 30.
+      keepalive (bool): If ``True``, a background thread connects to
+        every node at once and pings nodes idle for ``keepalive_interval``
+        seconds (default 30) with the health probe, so that a failover
+        finds a warm connection and an up to date ranking. Defaults to
+        ``False``; see also :meth:`prewarm`.
+      tls_session_reuse (bool): If ``True`` (default), new TLS connections
+        resume the session of the previous one to the same node, see
+        :class:`beowulfbase.transports.TLSSessionContext`.
+      hedge (bool): If ``True``, idempotent reads that take longer than
+        the ``hedge_percentile`` (default 95) of recent latencies are sent
+        to a second node as well, and the first reply wins. Broadcasts are
+        never hedged. Defaults to ``False``.
+      json_codec (str, JsonCodec): JSON library used for requests and
+        responses: ``'orjson'``, ``'ujson'``, ``'json'`` or a
+        :class:`beowulfbase.json_codec.JsonCodec`. Defaults to the fastest
+        one installed.
+      coalesce (bool): If ``True`` (default), identical idempotent reads
+        issued concurrently from several threads share a single request.
+      coalesce_window (float): Seconds a finished read may still be shared
+        with identical calls. Defaults to 0.
+      max_tries (int): Retries of a call before its error is raised.
+        Defaults to 10.
+      backoff_base (float), backoff_max (float): Retries after the first
+        pass over the nodes wait a random time between 0 and
+        ``backoff_base * 2 ** tries`` seconds, capped at ``backoff_max``
+        (exponential backoff with full jitter). Default to 0.5 and 10.
+      retry_budget (RetryBudget): Token bucket shared by all calls of the
+        client; a call whose retry finds it empty fails at once. Defaults
+        to 20 retries, refilled at 2 per second. ``None`` disables it.
+      deadline (float): Seconds a call may take in total, retries
+        included. A call can also pass its own ``deadline=`` keyword.
+        Within a deadline urllib3 does not retry on its own. Defaults to
+        ``None`` (no deadline).
+      metrics (Instrumentation): Receives the latency, size, decode time
+        and outcome of every request and every retry, see
+        :class:`beowulfbase.metrics.MetricsRegistry`. Defaults to ``None``.
+      adaptive_concurrency (bool): If ``True`` (default), the number of
+        requests in flight to each node adapts to its latency and to
+        overload errors, between 1 and ``max_concurrency`` (default 32),
+        see :class:`beowulfbase.concurrency.AdaptiveLimiter`.
+      limiter (AdaptiveLimiter): A limiter to share with other clients.
+      high_priority_methods (list): Methods which never wait behind other
+        requests for a slot of the limiter, and may use its reserved
+        slots. Defaults to broadcasts and the reads needed to sign one.
+        Other calls take the priority set with :meth:`priority`.
+      probe_nodes (bool): If ``True`` (default), the capabilities of every
+        node (``condenser_api`` and batch support, version, chain id) are
+        probed in a background thread when the client is created, unless
+        ``capability_store`` has them; see :meth:`probe_capabilities`.
+      capability_store (CapabilityStore): Where probed capabilities are
+        kept. Defaults to a SQLite file in the beowulf user data
+        directory, shared by all processes, which :meth:`close` closes;
+        ``False`` keeps them in memory.
+
+    Each call goes to the node with the best latency and error record,
+    see :class:`beowulfbase.node_pool.NodePool`.
+
+    Nodes on the same host can be reached through a Unix domain socket,
+    with ``http+unix://%2Frun%2Fbeowulfd.sock`` or
+    ``unix:///run/beowulfd.sock``. ``http://`` nodes on localhost get a
+    dedicated keep-alive pool; see :mod:`beowulfbase.transports`.
 
     .. code-block:: python
 
@@ -55,17 +195,49 @@ class HttpClient(object):
        )
     """
 
-    # set of endpoints which were detected to not support condenser_api
-    non_appbase_nodes = set()
-    # non_appbase_nodes = set(['http://192.168.1.113:9876/rpc'])
-
     def __init__(self, nodes, **kwargs):
+        # set of endpoints which were detected to not support condenser_api
+        self.non_appbase_nodes = set()
+        # set of endpoints which were detected to reject JSON-RPC batches
+        self.non_batch_nodes = set()
+
         self.re_raise = kwargs.get('re_raise', True)
+        self.max_tries = kwargs.get('max_tries', 10)
+        self.backoff_base = kwargs.get('backoff_base', 0.5)
+        self.backoff_max = kwargs.get('backoff_max', 10)
+        self.retry_budget = kwargs.get('retry_budget', RetryBudget())
+        self.deadline = kwargs.get('deadline', None)
+        self.metrics = kwargs.get('metrics', None)
+
+        self.limiter = kwargs.get('limiter', None)
+        if self.limiter is None and kwargs.get('adaptive_concurrency', True):
+            self.limiter = AdaptiveLimiter(
+                max_limit=kwargs.get('max_concurrency', 32))
+        self.high_priority_methods = frozenset(
+            kwargs.get('high_priority_methods', high_priority_methods))
+        self._local = threading.local()
         self.max_workers = kwargs.get('max_workers', None)
+        self.codec = get_codec(kwargs.get('json_codec', None))
+
+        self.hedge = kwargs.get('hedge', False)
+        self.hedge_methods = frozenset(
+            kwargs.get('hedge_methods', idempotent_methods))
+        self.hedge_percentile = kwargs.get('hedge_percentile', 95)
+        self.hedge_min_delay = kwargs.get('hedge_min_delay', 0.05)
+        self._hedge_latencies = deque(maxlen=kwargs.get('hedge_window', 200))
+        self._hedge_executor = None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        self.coalesce = kwargs.get('coalesce', True)
+        self.coalesce_methods = frozenset(
+            kwargs.get('coalesce_methods', idempotent_methods))
+        self._single_flight = SingleFlight(kwargs.get('coalesce_window', 0))
 
         num_pools = kwargs.get('num_pools', 10)
-        maxsize = kwargs.get('maxsize', 10)
-        timeout = kwargs.get('timeout', 60)
+        maxsize = kwargs.get('maxsize', self._max_concurrency +
+                             getattr(self.limiter, 'reserved', 0))
+        self.timeout = timeout = kwargs.get('timeout', 60)
         retries = kwargs.get('retries', 20)
         pool_block = kwargs.get('pool_block', False)
         tcp_keepalive = kwargs.get('tcp_keepalive', True)
@@ -76,6 +248,15 @@ class HttpClient(object):
         else:
             socket_options = HTTPConnection.default_socket_options
 
+        # with session reuse, the SSL context is created for the first
+        # https node (see _transport), so that clients of local nodes do
+        # not load certificates
+        self.tls_session_reuse = kwargs.get('tls_session_reuse', True)
+        if self.tls_session_reuse:
+            tls_kwargs = {}
+        else:
+            tls_kwargs = dict(ca_certs=certifi.where())
+
         self.http = urllib3.poolmanager.PoolManager(
             num_pools=num_pools,
             maxsize=maxsize,
@@ -85,27 +266,229 @@ class HttpClient(object):
             socket_options=socket_options,
             headers={'Content-Type': 'application/json'},
             cert_reqs='CERT_REQUIRED',
-            ca_certs=certifi.where())
+            **tls_kwargs)
         '''
             urlopen(method, url, body=None, headers=None, retries=None,
             redirect=True, assert_same_host=True, timeout=<object object>,
             pool_timeout=None, release_conn=None, chunked=False, body_pos=None,
             **response_kw)
         '''
-
-        self.nodes = cycle(self.sanitize_nodes(nodes))
-        self.url = ''
-        self.request = None
-        self.next_node()
+        # settings of the dedicated pools of unix socket and local nodes
+        self._pool_kwargs = dict(
+            maxsize=maxsize,
+            block=pool_block,
+            timeout=timeout,
+            retries=retries,
+            socket_options=socket_options,
+            headers={'Content-Type': 'application/json'})
+        self._transports = {}
+        self._transports_lock = threading.Lock()
+
+        self.probe_timeout = kwargs.get('probe_timeout', 5)
+        self.nodes = self.sanitize_nodes(nodes)
+        self.node_pool = NodePool(
+            self.nodes,
+            probe=self._probe_node,
+            failure_threshold=kwargs.get('failure_threshold', 3),
+            reset_timeout=kwargs.get('reset_timeout', 30),
+            keepalive=self._probe_node if kwargs.get('keepalive') else None,
+            keepalive_interval=kwargs.get('keepalive_interval', 30))
+        self._preferred_url = None
 
         log_level = kwargs.get('log_level', logging.INFO)
         logger.setLevel(log_level)
 
-    def _curr_node_downgraded(self):
-        return self.url in HttpClient.non_appbase_nodes
+        self.node_capabilities = {}
+        self._capability_store = kwargs.get('capability_store', None)
+        self._capability_store_lock = threading.Lock()
+        self._owns_capability_store = False
+        self._closed = False
+        if kwargs.get('probe_nodes', True):
+            # requests use the default capabilities until the probe is done
+            prober = threading.Thread(target=self._probe_in_background,
+                                      name='beowulf-capability-probe')
+            prober.daemon = True
+            prober.start()
 
-    def _downgrade_curr_node(self):
-        HttpClient.non_appbase_nodes.add(self.url)
+    @property
+    def capability_store(self):
+        """ The :class:`CapabilityStore` of the client, or ``None``.
+
+        The default store is opened on first use, by the background probe
+        or by the first request which finds out a node capability, so
+        that creating a client does not wait for SQLite.
+        """
+        if self._capability_store is None:
+            with self._capability_store_lock:
+                if self._capability_store is None and not self._closed:
+                    try:
+                        self._capability_store = CapabilityStore()
+                        self._owns_capability_store = True
+                    except (OSError, sqlite3.Error) as e:
+                        logger.info('Node capabilities will not be '
+                                    'persisted -- %s: %s',
+                                    e.__class__.__name__, e)
+                        self._capability_store = False
+        return self._capability_store or None
+
+    def _node_downgraded(self, url):
+        return url in self.non_appbase_nodes
+
+    def _downgrade_node(self, url):
+        self.non_appbase_nodes.add(url)
+        if self.capability_store is not None:
+            self.capability_store.update(url, condenser_api=False)
+
+    def _node_batches(self, url):
+        return url not in self.non_batch_nodes
+
+    def _curr_node_batches(self):
+        return self._node_batches(self.url)
+
+    def _downgrade_node_batch(self, url):
+        self.non_batch_nodes.add(url)
+        if self.capability_store is not None:
+            self.capability_store.update(url, batch=False)
+
+    def _probe_in_background(self):
+        if self._closed:
+            return
+        try:
+            self.probe_capabilities()
+        except Exception as e:
+            # the client was closed meanwhile, or the store failed
+            logger.info('Could not probe the nodes -- %s: %s',
+                        e.__class__.__name__, e)
+
+    def probe_capabilities(self, urls=None, force=False):
+        """ Find out which APIs, batch support, version and chain each
+        node has, so that requests are routed correctly.
+
+        A new client calls it in a background thread unless
+        ``probe_nodes`` is ``False``; call it directly to wait for the
+        probes.
+
+        Known capabilities come from ``self.capability_store``; the other
+        nodes are probed in parallel, waiting up to ``probe_timeout``
+        seconds. Probes which take longer still apply their result when
+        they finish. A node which cannot be probed keeps the defaults
+        (``condenser_api`` and batches) until a request proves otherwise.
+
+        Args:
+            urls (list): Nodes to probe. Defaults to all nodes.
+            force (bool): Probe even nodes whose capabilities are stored.
+
+        Returns:
+            dict: Capabilities by node URL, ``None`` for nodes whose probe
+            failed or has not finished yet.
+        """
+        urls = self.nodes if urls is None else urls
+        store = self.capability_store
+        futures = []
+        for url in urls:
+            capabilities = None
+            if store is not None and not force:
+                capabilities = store.get(url)
+            if capabilities is not None:
+                self._apply_capabilities(url, capabilities)
+            else:
+                futures.append(self.executor.submit(
+                    self._probe_and_apply_capabilities, url))
+        if futures:
+            concurrent.futures.wait(futures, timeout=self.probe_timeout)
+        return {url: self.node_capabilities.get(url) for url in urls}
+
+    def _probe_and_apply_capabilities(self, url):
+        try:
+            capabilities = self._probe_capabilities(url)
+        except Exception as e:
+            logger.info('Could not probe %s -- %s: %s', url,
+                        e.__class__.__name__, e)
+            return
+        self._apply_capabilities(url, capabilities)
+        store = self.capability_store
+        if store is not None:
+            try:
+                store.set(url, capabilities)
+            except sqlite3.Error as e:
+                # closed by close() while the probe ran, or locked
+                logger.info('Could not store the capabilities of %s -- '
+                            '%s: %s', url, e.__class__.__name__, e)
+
+    def _probe_capabilities(self, url):
+        """ Probe node ``url`` with ``get_version`` and ``get_config``,
+        sent as one batch through ``condenser_api``. Raises if the node
+        does not answer or fails with a recoverable error. """
+        transport = self._transport(url)
+
+        def check(reply):
+            # a lock or an upstream timeout says nothing about the node
+            error = reply.get('error') if isinstance(reply, dict) else None
+            if isinstance(error, dict) and 'message' in error and \
+                    'code' in error and self._is_error_recoverable(error):
+                raise RPCErrorRecoverable(reply)
+            return reply
+
+        def post(body):
+            response = transport.urlopen('POST', url, body=body,
+                                         retries=False,
+                                         timeout=self.probe_timeout)
+            if response.status != 200:
+                raise RuntimeError("non-200 response: %s from %s" %
+                                   (response.status, urlparse(url).hostname))
+            return check(self.codec.loads(response.data))
+
+        def send(requests, batch):
+            if batch:
+                replies = post(b'[' + b','.join(
+                    self.codec.encode_request(name, [], api, i)
+                    for i, (name, api) in enumerate(requests)) + b']')
+                if not isinstance(replies, list):
+                    if isinstance(replies, dict) and \
+                            not self._is_batch_rejection(replies):
+                        self._raise_for_error(replies)
+                    return None
+                replies = {reply.get('id'): check(reply)
+                           for reply in replies}
+                return [replies.get(i, {}) for i in range(len(requests))]
+            return [post(self.codec.encode_request(name, [], api))
+                    for name, api in requests]
+
+        capabilities = {'condenser_api': True, 'batch': True}
+        requests = [('get_version', 'condenser_api'),
+                    ('get_config', 'condenser_api')]
+        replies = send(requests, batch=True)
+        if replies is None:
+            capabilities['batch'] = False
+            replies = send(requests, batch=False)
+        if any('error' in reply for reply in replies):
+            capabilities['condenser_api'] = False
+            replies = send([('get_version', 'login_api'),
+                            ('get_config', 'database_api')],
+                           batch=capabilities['batch'])
+            for reply in replies:
+                self._raise_for_error(reply)
+
+        version, config = [reply.get('result') for reply in replies]
+        config = config or {}
+        capabilities.update(
+            version=version,
+            chain_id=config.get('BWF_CHAIN_ID'),
+            testnet=config.get('IS_TEST_NET'),
+            probed_at=time.time())
+        return capabilities
+
+    def _apply_capabilities(self, url, capabilities):
+        """ Route requests to ``url`` according to its capabilities. """
+        self.node_capabilities[url] = capabilities
+        if capabilities.get('condenser_api', True):
+            self.non_appbase_nodes.discard(url)
+        else:
+            self.non_appbase_nodes.add(url)
+        if capabilities.get('batch', True):
+            self.non_batch_nodes.discard(url)
+        else:
+            self.non_batch_nodes.add(url)
 
     def _is_error_recoverable(self, error):
         assert 'message' in error, "missing error msg key: {}".format(error)
@@ -137,21 +520,188 @@ class HttpClient(object):
 
         return False
 
+    @staticmethod
+    def _is_batch_rejection(result):
+        """ ``True`` if ``result``, the reply to a whole batch, says that
+        the node does not accept batches rather than reporting an error
+        of its own. """
+        error = result.get('error')
+        if not isinstance(error, dict):
+            # not an error object at all
+            return True
+        # {"code": -32600, "message": "Invalid Request"}, or -32700 from
+        # nodes which cannot parse a list
+        message = str(error.get('message', '')).lower()
+        return error.get('code') in (-32600, -32700) or \
+            'invalid request' in message or 'batch' in message
+
+    def _raise_for_node_error(self, url, result):
+        """ Like ``_raise_for_error``, for a response from node ``url``.
+
+        A node which no longer serves ``condenser_api`` (e.g. after an
+        upgrade) is downgraded, and ``RPCErrorRecoverable`` is raised so
+        that the call is retried through the method's own api.
+        """
+        error = result.get('error')
+        if isinstance(error, dict):
+            # {"code": -32601, "message": "Assert Exception:api_itr !=
+            #  _registered_apis.end(): Could not find API condenser_api"}
+            message = str(error.get('message', ''))
+            if 'condenser_api' in message and \
+                    'could not find' in message.lower():
+                # several requests in flight may find out at once
+                if not self._node_downgraded(url):
+                    logger.info('%s does not serve condenser_api',
+                                urlparse(url).hostname)
+                    self._downgrade_node(url)
+                raise RPCErrorRecoverable(result)
+        self._raise_for_error(result)
+
+    def _raise_for_error(self, result):
+        """ Raise if a JSON-RPC response object carries an error.
+
+        Errors classified by ``_is_error_recoverable`` raise
+        ``RPCErrorRecoverable`` so that ``call`` fails over and retries;
+        anything else is raised as a ``RuntimeError``.
+        """
+        if 'error' not in result:
+            return
+        error = result['error']
+        if isinstance(error, dict) and 'message' in error \
+                and 'code' in error and self._is_error_recoverable(error):
+            raise RPCErrorRecoverable(result)
+        raise RuntimeError(result)
+
+    def _retry_or_raise(self, e, tries, url, deadline=None, name=None):
+        """ Pick the node to retry on after a retryable error on ``url``.
+
+        Re-raises ``e`` once ``max_tries`` is reached, the retry budget is
+        spent or the ``deadline`` (a ``time.time()`` value) would pass
+        before the retry, otherwise returns the updated number of tries and
+        the next node. Failing over to a healthy node is immediate during
+        the first pass over the nodes; after that, or when no healthy node
+        is left, we back off first.
+
+        Only the failing request moves to another node, other requests in
+        flight keep using theirs.
+        """
+        if e == ValueError and 'JSON' not in e.args[0]:
+            raise e  # (python<3.5 lacks json.decoder.JSONDecodeError)
+        if not isinstance(e, DeadlineExceeded):
+            self.node_pool.record_failure(url)
+        if tries >= self.max_tries:
+            logging.error('Failed after %d attempts -- %s: %s',
+                          tries, e.__class__.__name__, e)
+            raise e
+        if deadline is not None and time.time() >= deadline:
+            logging.error('Deadline exceeded after %d attempts -- %s: %s',
+                          tries + 1, e.__class__.__name__, e)
+            raise e
+        if self.retry_budget is not None and \
+                not self.retry_budget.acquire():
+            logging.error('Retry budget exhausted -- %s: %s',
+                          e.__class__.__name__, e)
+            raise e
+        tries += 1
+        next_url = self.node_pool.best(exclude=url)
+        if self.metrics is not None:
+            self.metrics.on_retry(name, url, next_url, e)
+        if tries <= len(self.nodes) and next_url != url \
+                and self.node_pool.is_available(next_url):
+            logging.warning('Retry on %s -- %s: %s',
+                            urlparse(next_url).hostname,
+                            e.__class__.__name__, e)
+        else:
+            delay = backoff_delay(tries, self.backoff_base, self.backoff_max)
+            if deadline is not None and time.time() + delay >= deadline:
+                logging.error('Deadline exceeded after %d attempts -- %s: %s',
+                              tries, e.__class__.__name__, e)
+                raise e
+            logging.warning('Retry in %.2fs -- %s: %s', delay,
+                            e.__class__.__name__, e)
+            time.sleep(delay)
+        return tries, next_url
+
+    def _probe_node(self, url):
+        """ Health check used by the node pool to close the circuit of
+        a node which has been failing. Raises if the node is unhealthy. """
+        body = self._encode_request(
+            url, 'get_dynamic_global_properties', (), {'api': 'database_api'})
+        response = self._transport(url).urlopen(
+            'POST', url, body=body, retries=False,
+            timeout=self.probe_timeout)
+        if response.status != 200:
+            raise RuntimeError("non-200 response: %s from %s" %
+                               (response.status, urlparse(url).hostname))
+        result = self.codec.loads(response.data)
+        self._raise_for_error(result)
+
+    def prewarm(self, urls=None):
+        """ Open a connection to each of ``urls`` (by default every node
+        but the current one) with a health probe, in parallel, so that
+        failing over to them skips DNS, TCP and TLS setup. Nodes that fail
+        the probe are recorded as failing.
+
+        Args:
+            urls (list): Nodes to connect to.
+
+        Returns:
+            dict: Probe latency by node URL, ``None`` for failed probes.
+        """
+        if urls is None:
+            current = self.url
+            urls = [url for url in self.nodes if url != current]
+
+        def ping(url):
+            start = time.time()
+            try:
+                self._probe_node(url)
+            except Exception as e:
+                logger.info('Could not prewarm %s -- %s: %s', url,
+                            e.__class__.__name__, e)
+                self.node_pool.record_failure(url)
+                return None
+            latency = time.time() - start
+            self.node_pool.record_success(url, latency)
+            return latency
+
+        return dict(zip(urls, self.executor.map(ping, urls)))
+
     def next_node(self):
         """ Switch to the next available node.
 
-        This method will change base URL of our requests.
+        This method will change base URL of our requests to the best
+        ranked node other than the current one.
 
         Use it when the current node goes down to change to a fallback
         node.
 
         """
-        self.set_node(next(self.nodes))
+        self.set_node(self.node_pool.best(exclude=self.url))
+
+    def _select_node(self):
+        """ Return the node for a new request: the node chosen with
+        ``set_node`` while it is healthy, the best ranked node otherwise.
+        """
+        url = self._preferred_url
+        if url is not None and self.node_pool.is_available(url):
+            return url
+        return self.node_pool.best()
 
     def set_node(self, node_url):
-        """ Change current node to provided node URL. """
-        self.url = node_url
-        self.request = partial(self.http.urlopen, 'POST', self.url)
+        """ Send new requests to the provided node URL for as long as
+        it stays healthy. """
+        self._preferred_url = node_url
+
+    @property
+    def url(self):
+        """ The node that the next request will be sent to. """
+        return self._select_node()
+
+    @property
+    def request(self):
+        url = self.url
+        return partial(self._transport(url).urlopen, 'POST', url)
 
     @property
     def hostname(self):
@@ -210,6 +760,242 @@ class HttpClient(object):
 
         return body
 
+    def _encode_request(self, url, name, args, kwargs, _id=0):
+        """ Encode a request for node ``url`` with ``self.codec``.
+
+        Same as ``json_rpc_body``, except that the call goes through
+        `condenser_api` unless ``url`` is known not to support it.
+        """
+        params = dict(kwargs)
+        api = params.pop('api', None)
+        if not self._node_downgraded(url):
+            api = 'condenser_api'
+        # `kwargs` for object-style param, `args` for list-style. pick one.
+        assert not (params and args), 'fail - passed array AND object args'
+        return self.codec.encode_request(
+            name, params if params else list(args), api, _id)
+
+    def _transport(self, url):
+        """ Return the transport for node ``url``, selected by its scheme:
+        a Unix socket pool for ``http+unix://`` and ``unix://``, a
+        dedicated keep-alive pool for ``http://`` nodes on this host and
+        ``self.http`` for everything else. See
+        :mod:`beowulfbase.transports`.
+        """
+        transport = self._transports.get(url)
+        if transport is None:
+            with self._transports_lock:
+                transport = self._transports.get(url)
+                if transport is None:
+                    transport = get_transport(url, self.http,
+                                              **self._pool_kwargs)
+                    if transport is self.http and self.tls_session_reuse \
+                            and urlparse(url).scheme == 'https' and \
+                            'ssl_context' not in self.http.connection_pool_kw:
+                        # certificates are loaded once here instead of
+                        # per connection
+                        self.http.connection_pool_kw['ssl_context'] = \
+                            TLSSessionContext(certifi.where())
+                    self._transports[url] = transport
+        return transport
+
+    def _urlopen(self, url, body, deadline=None, **kwargs):
+        """ POST ``body`` to ``url``.
+
+        Before ``deadline`` (a ``time.time()`` value), urllib3 does not
+        retry on its own and the request times out when the deadline
+        passes, so that only ``call`` decides about retries. Other kwargs
+        are passed to ``urlopen``.
+        """
+        transport = self._transport(url)
+        if deadline is None:
+            return transport.urlopen('POST', url, body=body, **kwargs)
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            raise DeadlineExceeded(None, url, 'Call deadline exceeded')
+        if isinstance(self.timeout, (int, float)):
+            timeout = min(timeout, self.timeout)
+        return transport.urlopen('POST', url, body=body, retries=0,
+                                 timeout=timeout, **kwargs)
+
+    def _request_node(self, url, name, *args, **kwargs):
+        """ Send a single request to ``url``, without retries. """
+        deadline = kwargs.pop('_deadline', None)
+        body = self._encode_request(url, name, args, kwargs)
+        self._acquire(url, self._priority(name), deadline)
+        start = time.time()
+        data, decode_time = b'', 0.0
+        try:
+            response = self._urlopen(url, body, deadline)
+            success_codes = tuple(list(response.REDIRECT_STATUSES) + [200])
+            if response.status not in success_codes:
+                raise RuntimeError("non-200 response: %s from %s" %
+                                   (response.status, urlparse(url).hostname))
+
+            data = response.data
+            decode_start = time.time()
+            result = self.codec.loads(data)
+            decode_time = time.time() - decode_start
+            assert result, 'result entirely blank'
+
+            self._raise_for_node_error(url, result)
+        except Exception as e:
+            self._release(url, overloaded=self._is_overload(e))
+            self._observe(name, url, time.time() - start, len(body),
+                          len(data), decode_time, e)
+            raise
+        latency = time.time() - start
+        self._release(url, latency)
+        self._observe(name, url, latency, len(body), len(data), decode_time)
+        self.node_pool.record_success(url, latency)
+        if self._is_hedgeable(name):
+            self._hedge_latencies.append(latency)
+        return result['result']
+
+    @contextmanager
+    def priority(self, level):
+        """ Send the calls made by this thread within the block with
+        priority ``level``.
+
+        Bulk fetchers use ``BULK`` so that interactive calls of other
+        threads get free slots of the limiter first; ``HIGH`` calls may
+        also use its reserved slots.
+
+        Args:
+            level (int): ``HIGH``, ``NORMAL`` or ``BULK`` from
+                :mod:`beowulfbase.concurrency`.
+
+        .. code-block:: python
+
+           with rpc.priority(HIGH):
+               props = rpc.call('get_dynamic_global_properties')
+
+        """
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = level
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def _priority(self, name=None):
+        if name in self.high_priority_methods:
+            return HIGH
+        level = getattr(self._local, 'priority', None)
+        return NORMAL if level is None else level
+
+    def _with_priority(self, fn, level=None):
+        """ Wrap ``fn`` to run with priority ``level``, by default the
+        one of the calling thread, on whichever thread calls it. """
+        if level is None:
+            level = getattr(self._local, 'priority', None)
+        if level is None:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            with self.priority(level):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def _acquire(self, url, priority=NORMAL, deadline=None):
+        """ Take a slot of the limiter for a request to ``url``, waiting
+        until ``deadline`` (a ``time.time()`` value) at most. """
+        if self.limiter is None:
+            return
+        timeout = None if deadline is None else \
+            max(0.0, deadline - time.time())
+        if not self.limiter.acquire(url, priority, timeout):
+            raise DeadlineExceeded(None, url, 'Call deadline exceeded')
+
+    def _release(self, url, latency=None, overloaded=False):
+        if self.limiter is not None:
+            self.limiter.release(url, latency, overloaded)
+
+    @staticmethod
+    def _is_overload(error):
+        """ ``True`` if ``error`` suggests that the node is overloaded:
+        a timeout or an error from ``overload_messages``. """
+        if isinstance(error, MaxRetryError):
+            error = error.reason
+        if isinstance(error, DeadlineExceeded):
+            return False
+        if isinstance(error, (ReadTimeoutError, socket.timeout)):
+            return True
+        if isinstance(error, ConnectTimeoutError):
+            # refused connections are no sign of load
+            return not isinstance(error, NewConnectionError)
+        if isinstance(error, RPCErrorRecoverable) and \
+                isinstance(error.data, dict):
+            message = (error.data.get('error') or {}).get('message')
+            return message in overload_messages
+        return False
+
+    def _observe(self, name, url, latency, bytes_out, bytes_in,
+                 decode_time, error=None):
+        if self.metrics is not None:
+            self.metrics.on_request(name, url, latency, bytes_out, bytes_in,
+                                    decode_time, error)
+
+    def _is_hedgeable(self, name):
+        return name in self.hedge_methods and \
+            not name.startswith('broadcast_')
+
+    def _hedge_delay(self):
+        """ Seconds to wait for the first node before hedging, i.e. the
+        ``hedge_percentile`` of the latencies of recent hedgeable reads.
+        """
+        latencies = sorted(self._hedge_latencies)
+        if len(latencies) < 20:
+            # not enough samples yet, stay conservative
+            return max(self.hedge_min_delay, 1.0)
+        index = min(len(latencies) - 1,
+                    int(len(latencies) * self.hedge_percentile / 100.0))
+        return max(self.hedge_min_delay, latencies[index])
+
+    def _hedged_request(self, primary, name, *args, **kwargs):
+        """ Send a read to node ``primary`` and, if it has not answered
+        within ``_hedge_delay()``, to the next best node as well.
+
+        Returns the first successful result. If every node fails, the
+        error of ``primary`` is raised so that ``call`` can fail over as
+        usual.
+        """
+        # hedges get their own threads: tasks running on `self.executor`
+        # wait for them, so sharing that pool could deadlock it
+        with self._executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = \
+                    concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers)
+        executor = self._hedge_executor
+        request = self._with_priority(self._request_node)
+
+        futures = {executor.submit(request, primary, name,
+                                   *args, **kwargs): primary}
+        done, _ = concurrent.futures.wait(futures,
+                                          timeout=self._hedge_delay())
+        if not done:
+            secondary = self.node_pool.best(exclude=primary)
+            if secondary != primary:
+                logger.debug('Hedging %s to %s', name, secondary)
+                futures[executor.submit(request, secondary,
+                                        name, *args, **kwargs)] = secondary
+
+        error = None
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except retry_exceptions as e:
+                if futures[future] == primary:
+                    error = e
+                else:
+                    self.node_pool.record_failure(futures[future])
+                continue
+            if error is not None:
+                self.node_pool.record_failure(primary)
+            return result
+        raise error
+
     def call(self,
              name,
              *args,
@@ -222,78 +1008,424 @@ class HttpClient(object):
             This command will auto-retry in case of node failure, as well
             as handle node fail-over.
 
-        """
-
-        # tuple of Exceptions which are eligible for retry
-        retry_exceptions = (MaxRetryError, ReadTimeoutError,
-                            ProtocolError, RPCErrorRecoverable,)
-
-        if sys.version > '3.5':
-            retry_exceptions += (json.decoder.JSONDecodeError, RemoteDisconnected,)
-        else:
-            retry_exceptions += (ValueError,)
-
-        if sys.version > '3.0':
-            retry_exceptions += (ConnectionResetError,)
-        else:
-            retry_exceptions += (HTTPException,)
+        A ``deadline=`` keyword (seconds) overrides the ``deadline`` of
+        the client for this call.
 
+        """
+        deadline = kwargs.pop('deadline', self.deadline)
+        if deadline is not None:
+            kwargs['_deadline'] = time.time() + deadline
+        if self.coalesce and name in self.coalesce_methods and \
+                set(kwargs) <= {'api', '_deadline'}:
+            key = json.dumps([name, args, kwargs.get('api')],
+                             sort_keys=True)
+            try:
+                return self._single_flight.do_within(
+                    deadline, key, self._call, name, *args, **kwargs)
+            except WaitTimeout:
+                # joined a call which outlives our own deadline
+                raise DeadlineExceeded(None, self.url,
+                                       'Call deadline exceeded')
+        return self._call(name, *args, **kwargs)
+
+    def _call(self, name, *args, **kwargs):
+        url = self._select_node()
+        deadline = kwargs.get('_deadline')
+        hedged = self.hedge and self._is_hedgeable(name) and \
+            len(self.nodes) > 1
         tries = 0
         while True:
             try:
-
-                body_kwargs = kwargs.copy()
-                if not self._curr_node_downgraded():
-                    body_kwargs['api'] = 'condenser_api'
-                body = HttpClient.json_rpc_body(name, *args, **body_kwargs)
-                response = self.request(body=body)
-                success_codes = tuple(list(response.REDIRECT_STATUSES) + [200])
-                if response.status not in success_codes:
-                    raise RuntimeError("non-200 response: %s from %s" % (response.status, self.hostname))
-
-                result = json.loads(response.data.decode('utf-8'))
-                assert result, 'result entirely blank'
-
-                if 'error' in result:
-                    raise RuntimeError(result)
-                return result['result']
+                if hedged:
+                    return self._hedged_request(url, name, *args, **kwargs)
+                return self._request_node(url, name, *args, **kwargs)
 
             except retry_exceptions as e:
-                if e == ValueError and 'JSON' not in e.args[0]:
-                    raise e  # (python<3.5 lacks json.decoder.JSONDecodeError)
-                if tries >= 10:
-                    logging.error('Failed after %d attempts -- %s: %s',
-                                  tries, e.__class__.__name__, e)
-                    raise e
-                tries += 1
-                logging.warning('Retry in %ds -- %s: %s', tries,
-                                e.__class__.__name__, e)
-                time.sleep(tries)
-                self.next_node()
+                tries, url = self._retry_or_raise(
+                    e, tries, url, deadline, name)
                 continue
 
             # TODO: unclear why this case is here; need to explicitly
             #       define exceptions for which we refuse to retry.
             except Exception as e:
-                extra = dict(err=e, request=self.request)
+                extra = dict(err=e, url=url)
                 logger.error('Unexpected exception! Please report at ' +
                              'https://github.com/beowulfchain/beowulf-python/issues' +
                              ' -- %s: %s', e.__class__.__name__, e, extra=extra)
                 raise e
 
+    def _stream_node(self, url, name, *args, **kwargs):
+        """ Like ``_request_node``, but yield the items of the result while
+        the response is being read from the socket.
+
+        The limiter slot is released once the first item has been parsed:
+        the node has answered by then, and the consumer may call the node
+        itself while it works on the items (the connection pools do not
+        block, so such calls get a connection of their own). The
+        connection goes back to the pool when the generator finishes, or
+        is closed if the generator is closed before the end of the
+        response.
+        """
+        deadline = kwargs.pop('_deadline', None)
+        body = self._encode_request(url, name, args, kwargs)
+        self._acquire(url, self._priority(name), deadline)
+        start = time.time()
+        response = None
+        finished = False
+        try:
+            try:
+                response = self._urlopen(url, body, deadline,
+                                         preload_content=False)
+                success_codes = tuple(
+                    list(response.REDIRECT_STATUSES) + [200])
+                if response.status not in success_codes:
+                    raise RuntimeError("non-200 response: %s from %s" % (
+                        response.status, urlparse(url).hostname))
+                items = iter_result(response,
+                                    partial(self._raise_for_node_error, url),
+                                    self.codec)
+                # an error reply has no items, so this raises it
+                first = next(items, _no_item)
+            except Exception as e:
+                self._release(url, overloaded=self._is_overload(e))
+                self._observe(name, url, time.time() - start, len(body),
+                              response.tell() if response else 0, 0.0, e)
+                raise
+            latency = time.time() - start
+            self._release(url, latency)
+            self.node_pool.record_success(url, latency)
+            try:
+                if first is not _no_item:
+                    yield first
+                    for item in items:
+                        yield item
+            except Exception as e:
+                self._observe(name, url, time.time() - start, len(body),
+                              response.tell(), 0.0, e)
+                raise
+            finished = True
+        finally:
+            if response is not None:
+                if not finished:
+                    # do not hand a half read connection back to the pool
+                    response.close()
+                response.release_conn()
+        # the time spent by the consumer on the items is included
+        self._observe(name, url, time.time() - start, len(body),
+                      response.tell(), 0.0)
+
+    def call_iter(self, name, *args, **kwargs):
+        """ Call a remote procedure which returns a list, and yield the
+        items of the list as they are parsed from the response.
+
+        The response is read from the socket incrementally instead of
+        being loaded and decoded at once, which keeps memory flat for
+        large replies such as ``get_ops_in_block`` and lets the caller
+        start before the last byte has arrived. Incremental parsing needs
+        `ijson`; without it the response is decoded in one piece.
+
+        Failures are retried like in ``call``, also partway through the
+        response: the retried response is read from the start and the
+        items already yielded are skipped. Only use it for calls whose
+        result does not change between tries, such as
+        ``get_ops_in_block`` of an irreversible block.
+
+        Example:
+
+        .. code-block:: python
+
+           for op in rpc.call_iter('get_ops_in_block', 1000, False,
+                                   api='condenser_api'):
+               print(op['op'][0])
+
+        """
+        deadline = kwargs.pop('deadline', self.deadline)
+        if deadline is not None:
+            deadline += time.time()
+            kwargs['_deadline'] = deadline
+        url = self._select_node()
+        tries = 0
+        yielded = 0
+        while True:
+            skip = yielded
+            try:
+                for item in self._stream_node(url, name, *args, **kwargs):
+                    if skip:
+                        skip -= 1
+                        continue
+                    yielded += 1
+                    yield item
+                return
+            except retry_exceptions as e:
+                tries, url = self._retry_or_raise(
+                    e, tries, url, deadline, name)
+
+    def call_batch(self, requests, deadline=None):
+        """ Call several remote procedures in a single JSON-RPC batch.
+
+        Args:
+
+            requests (list): ``(name, args)`` or ``(name, args, api)``
+            tuples, where ``args`` is the list of positional arguments for
+            the method ``name``.
+
+            deadline (float): Seconds the whole batch may take, retries
+            included. Defaults to the ``deadline`` of the client.
+
+        Returns:
+
+            list: The results, in the same order as ``requests``.
+
+        Members of the batch that fail with a recoverable error (or are
+        missing from the response) are retried on the next node; the ones
+        that already succeeded are not sent again. If the node does not
+        accept batches, the remaining requests are sent one by one with
+        ``call`` and the node is remembered as not supporting batches.
+
+        Example:
+
+        .. code-block:: python
+
+           rpc.call_batch([
+               ('get_block', [1], 'database_api'),
+               ('get_block', [2], 'database_api'),
+           ])
+
+        """
+        requests = [tuple(r) + (None,) * (3 - len(r)) for r in requests]
+        results = [None] * len(requests)
+        pending = list(range(len(requests)))
+
+        if deadline is None:
+            deadline = self.deadline
+        if deadline is not None:
+            deadline += time.time()
+
+        url = self._select_node()
+        tries = 0
+        while pending:
+            if not self._node_batches(url):
+                for i in pending:
+                    name, args, api = requests[i]
+                    if deadline is None:
+                        results[i] = self.call(name, *args, api=api)
+                    else:
+                        results[i] = self.call(
+                            name, *args, api=api,
+                            deadline=deadline - time.time())
+                break
+
+            # series of a batch are labelled with its methods, so that
+            # the bulk paths show up next to the single calls
+            method = ','.join(sorted(set(requests[i][0] for i in pending)))
+            try:
+                body = b'[' + b','.join(
+                    self._encode_request(url, requests[i][0],
+                                         requests[i][1],
+                                         {'api': requests[i][2]}, _id=i)
+                    for i in pending) + b']'
+                self._acquire(url, min(self._priority(requests[i][0])
+                                       for i in pending), deadline)
+                start = time.time()
+                latency, overloaded = None, False
+                data, decode_time = b'', 0.0
+                try:
+                    try:
+                        response = self._urlopen(url, body, deadline)
+                        success_codes = tuple(
+                            list(response.REDIRECT_STATUSES) + [200])
+                        if response.status not in success_codes:
+                            raise RuntimeError(
+                                "non-200 response: %s from %s" %
+                                (response.status, urlparse(url).hostname))
+
+                        data = response.data
+                        decode_start = time.time()
+                        result = self.codec.loads(data)
+                        decode_time = time.time() - decode_start
+                    except Exception as e:
+                        overloaded = self._is_overload(e)
+                        self._observe(method, url, time.time() - start,
+                                      len(body), len(data), decode_time, e)
+                        raise
+                    latency = time.time() - start
+                    self._observe(method, url, latency, len(body),
+                                  len(data), decode_time)
+                    if not isinstance(result, list):
+                        # a lock or an upstream timeout answered for the
+                        # whole batch is retried, not taken as a refusal
+                        if isinstance(result, dict) and \
+                                not self._is_batch_rejection(result):
+                            self._raise_for_error(result)
+                        logger.info('%s does not support batch requests',
+                                    urlparse(url).hostname)
+                        self._downgrade_node_batch(url)
+                        continue
+
+                    responses = dict((r.get('id'), r) for r in result
+                                     if isinstance(r, dict))
+                    failed = []
+                    for i in pending:
+                        member = responses.get(i)
+                        if member is None:
+                            failed.append(i)
+                            continue
+                        try:
+                            self._raise_for_node_error(url, member)
+                        except RPCErrorRecoverable as e:
+                            overloaded = overloaded or self._is_overload(e)
+                            failed.append(i)
+                            continue
+                        results[i] = member['result']
+                finally:
+                    self._release(url, latency, overloaded)
+
+                if len(failed) < len(pending):
+                    self.node_pool.record_success(url, latency)
+                if failed:
+                    message = '%d of %d batch members failed' % (
+                        len(failed), len(pending))
+                    pending = failed
+                    raise RPCErrorRecoverable(message)
+                pending = failed
+
+            except retry_exceptions as e:
+                tries, url = self._retry_or_raise(
+                    e, tries, url, deadline, method)
+                continue
+
+        return results
+
+    @property
+    def executor(self):
+        """ Thread pool shared by all concurrent calls of this client.
+
+        Its size is set by the ``max_workers`` kwarg, and defaults to the
+        highest concurrency allowed per node, like the connection pool of
+        each node.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers or self._max_concurrency)
+            return self._executor
+
+    @property
+    def _max_concurrency(self):
+        if self.limiter is None:
+            return 10
+        return self.limiter.max_limit
+
+    def _in_flight_window(self, max_in_flight=None):
+        """ ``max_in_flight`` if given, else the current concurrency limit
+        of the best node (as a callable, see ``imap``). """
+        if max_in_flight:
+            return max_in_flight
+        if self.limiter is None:
+            return 10
+        return lambda: self.limiter.limit(self.url)
+
+    def imap(self, fn, iterable, ordered=True, max_in_flight=None,
+             priority=None):
+        """ Apply ``fn`` to every item of ``iterable`` on ``self.executor``.
+
+        At most ``max_in_flight`` items are running or waiting to be
+        consumed at any time, and ``iterable`` is only read as capacity
+        frees up, so neither the input nor the results are buffered
+        beyond that window.
+
+        Args:
+            fn (callable): Called with a single item.
+            iterable: The items, may be a generator.
+            ordered (bool): Yield results in input order, as soon as all
+                results before them are available. Otherwise they are
+                yielded as they complete.
+            max_in_flight (int, callable): Size of the window, or a callable
+                returning it, which is asked again whenever an item is
+                submitted. Defaults to the adaptive concurrency limit of
+                the best node.
+            priority (int): Priority of the calls made by ``fn``, see
+                :meth:`priority`. Defaults to the one of the calling
+                thread.
+
+        Returns:
+            A generator with results.
+        """
+        executor = self.executor
+        fn = self._with_priority(fn, priority)
+        items = iter(iterable)
+        pending = deque()
+        window = self._in_flight_window(max_in_flight)
+        if not callable(window):
+            window = partial(int, window)
+
+        def submit():
+            while len(pending) < window():
+                for item in items:
+                    pending.append(executor.submit(fn, item))
+                    break
+                else:
+                    return
+
+        submit()
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            result = future.result()
+            submit()
+            yield result
+
     def call_multi_with_futures(self, name, params, api=None,
-                                max_workers=None):
-        with concurrent.futures.ThreadPoolExecutor(
-                max_workers=max_workers) as executor:
-            # Start the load operations and mark each future with its URL
-            def ensure_list(val):
-                return val if isinstance(val, (list, tuple, set)) else [val]
-
-            futures = (executor.submit(
-                self.call, name, *ensure_list(param), api=api)
-                for param in params)
-            for future in concurrent.futures.as_completed(futures):
-                yield future.result()
+                                max_workers=None, ordered=False,
+                                max_in_flight=None):
+        """ Call ``name`` once for every entry of ``params`` concurrently.
+
+        Args:
+            name (str): Method name.
+            params: Arguments of each call; an entry that is not a list
+                is passed as the only argument.
+            api (str): Api of the method.
+            max_workers (int): Kept for compatibility, used as
+                ``max_in_flight`` when the latter is not given.
+            ordered (bool): Yield results in the order of ``params``
+                instead of as they complete.
+            max_in_flight (int): Maximum number of calls in flight.
+                Defaults to the adaptive concurrency limit of the node.
+
+        Returns:
+            A generator with results.
+        """
+        def ensure_list(val):
+            return val if isinstance(val, (list, tuple, set)) else [val]
+
+        def call(param):
+            return self.call(name, *ensure_list(param), api=api)
+
+        return self.imap(call, params, ordered=ordered,
+                         max_in_flight=max_in_flight or max_workers)
+
+    def close(self):
+        """ Stop the background threads and close all connections. """
+        self.node_pool.close()
+        for executor in (self._executor, self._hedge_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._executor = self._hedge_executor = None
+        for transport in self._transports.values():
+            if transport is not self.http:
+                transport.clear()
+        self._transports.clear()
+        self.http.clear()
+        with self._capability_store_lock:
+            self._closed = True
+            store, self._capability_store = self._capability_store, False
+        if store and self._owns_capability_store:
+            store.close()
 
     def sanitize_nodes(self, nodes):
         """
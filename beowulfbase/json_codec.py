@@ -0,0 +1,205 @@
+# coding=utf-8
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec(object):
+    """ JSON encoder/decoder used by the HTTP clients, based on the
+    standard library.
+
+    Subclasses plug in faster libraries. Every codec encodes to UTF-8
+    bytes, decodes straight from bytes and raises the standard library's
+    ``json.JSONDecodeError`` on malformed input, so that the clients'
+    retry handling works the same with every codec.
+    """
+    name = 'json'
+
+    def __init__(self):
+        self._prefixes = {}
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf8')
+
+    def loads(self, data):
+        if isinstance(data, bytes) and sys.version_info < (3, 6):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def _prefix(self, name, api):
+        # the part of a request body that only depends on the method
+        prefix = self._prefixes.get((api, name))
+        if prefix is None:
+            if api:
+                prefix = b'{"jsonrpc":"2.0","method":"call","params":[' + \
+                    self.dumps(api) + b',' + self.dumps(name) + b','
+            else:
+                prefix = b'{"jsonrpc":"2.0","method":' + \
+                    self.dumps(name) + b',"params":'
+            self._prefixes[(api, name)] = prefix
+        return prefix
+
+    def encode_request(self, name, params, api=None, _id=0):
+        """ Encode a JSON-RPC request, like ``HttpClient.json_rpc_body``,
+        reusing the precompiled prefix of ``name``.
+
+        Args:
+            name (str): Method name (ie: `get_block`).
+            params (list, dict): Method parameters.
+            api (str): If given, ``name`` is called through ``call`` on
+                this api (ie: `condenser_api`).
+            _id (int): JSON-RPC request id.
+
+        Returns:
+            bytes: The encoded request.
+        """
+        body = self._prefix(name, api) + self.dumps(params)
+        if api:
+            body += b']'
+        return body + b',"id":' + self.dumps(_id) + b'}'
+
+
+class UjsonCodec(JsonCodec):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        super(UjsonCodec, self).__init__()
+        self._ujson = ujson
+
+    def dumps(self, obj):
+        return self._ujson.dumps(obj, ensure_ascii=False).encode('utf8')
+
+    def loads(self, data):
+        try:
+            return self._ujson.loads(data)
+        except ValueError:
+            # let the standard library raise a json.JSONDecodeError
+            return super(UjsonCodec, self).loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        super(OrjsonCodec, self).__init__()
+        self._orjson = orjson
+
+    def dumps(self, obj):
+        try:
+            return self._orjson.dumps(obj)
+        except TypeError:
+            # ie: integers above 64 bit
+            return super(OrjsonCodec, self).dumps(obj)
+
+    def loads(self, data):
+        try:
+            return self._orjson.loads(data)
+        except ValueError:
+            return super(OrjsonCodec, self).loads(data)
+
+
+codecs = {
+    'orjson': OrjsonCodec,
+    'ujson': UjsonCodec,
+    'json': JsonCodec,
+}
+
+
+def get_codec(codec=None):
+    """ Return a codec instance.
+
+    Args:
+        codec (None, str, JsonCodec): A codec instance, the name of one of
+            ``codecs`` or ``None`` to use the fastest installed library
+            (orjson, then ujson, then the standard library).
+    """
+    if isinstance(codec, JsonCodec):
+        return codec
+    if codec is not None:
+        return codecs[codec]()
+    for name in ('orjson', 'ujson'):
+        try:
+            return codecs[name]()
+        except ImportError:
+            continue
+    return JsonCodec()
+
+
+_container_events = ('start_map', 'start_array')
+
+
+def _parse_events(ijson, fp):
+    # ijson raises its own errors; every codec promises the standard
+    # library's, which the clients retry on
+    try:
+        for event in ijson.parse(fp, use_float=True):
+            yield event
+    except ijson.JSONError as e:
+        raise json.JSONDecodeError(str(e).splitlines()[0], '', 0)
+
+
+def iter_result(fp, raise_for_error, codec=None):
+    """ Parse a JSON-RPC response from the file-like ``fp`` and yield the
+    items of its ``result`` as soon as each one has been read.
+
+    With `ijson <https://pypi.org/project/ijson/>`_ installed the response
+    is parsed incrementally, so only the item being parsed is held in
+    memory. Without it, the whole response is read and decoded with
+    ``codec`` first.
+
+    A result that is not a list is yielded as a single item. If the
+    response carries an error, ``raise_for_error`` is called with the
+    response object instead. Malformed or truncated JSON raises
+    ``json.JSONDecodeError``, like the codecs.
+
+    Args:
+        fp: File-like object with a ``read(size)`` method returning bytes.
+        raise_for_error (callable): Called as ``raise_for_error({'error':
+            error})``, expected to raise.
+        codec (JsonCodec): Codec used when ijson is not installed.
+    """
+    try:
+        import ijson
+        from ijson.common import ObjectBuilder
+    except ImportError:
+        result = (codec or JsonCodec()).loads(fp.read())
+        raise_for_error(result)
+        result = result['result']
+        for item in result if isinstance(result, list) else [result]:
+            yield item
+        return
+
+    error = builder = target = None
+    depth = 0
+    for prefix, event, value in _parse_events(ijson, fp):
+        if builder is not None:
+            builder.event(event, value)
+            if event in _container_events:
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if depth == 0:
+                    if target == 'error':
+                        error = builder.value
+                    else:
+                        yield builder.value
+                    builder = None
+            continue
+        if prefix == 'result' and event in ('start_array', 'end_array'):
+            continue
+        if prefix not in ('result', 'result.item', 'error') or \
+                event == 'map_key':
+            continue
+        if event in _container_events:
+            builder, target, depth = ObjectBuilder(), prefix, 1
+            builder.event(event, value)
+        elif prefix == 'error':
+            error = value
+        else:
+            yield value
+    if error is not None:
+        raise_for_error({'error': error})
@@ -0,0 +1,238 @@
+# coding=utf-8
+import bisect
+import threading
+
+#: upper bounds (seconds) of the latency histogram buckets
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+#: upper bounds (seconds) of the block lateness histogram buckets
+lateness_buckets = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Instrumentation(object):
+    """ Hooks called by :class:`beowulfbase.http_client.HttpClient`.
+
+    Subclass it and override the hooks you need, then pass an instance as
+    the ``metrics`` kwarg of the client. Hooks run on the thread that made
+    the request, so they must be quick and thread-safe.
+    """
+
+    def on_request(self, method, url, latency, bytes_out, bytes_in,
+                   decode_time, error=None):
+        """ Called after every request sent to a node.
+
+        Args:
+            method (str): RPC method. Batches report the methods of
+                their members, comma separated and sorted.
+            url (str): The node.
+            latency (float): Seconds from sending the request to having
+                the decoded response (or the error).
+            bytes_out (int): Size of the request body.
+            bytes_in (int): Size of the response body, 0 if none was read.
+            decode_time (float): Seconds spent decoding the JSON response.
+            error (Exception): The error raised by the request, if any.
+        """
+
+    def on_retry(self, method, url, next_url, error):
+        """ Called when a request to ``url`` failed with ``error`` and is
+        retried on ``next_url`` (a failover when the two differ). """
+
+    def on_block(self, block_num, lateness):
+        """ Called by the streams of :class:`beowulf.blockchain.Blockchain`
+        when they deliver a block.
+
+        Args:
+            block_num (int): The block.
+            lateness (float): Seconds from the block's timestamp to its
+                delivery.
+        """
+
+
+class _Series(object):
+    __slots__ = ('requests', 'errors', 'buckets', 'latency', 'bytes_out',
+                 'bytes_in', 'decode_time', 'retries', 'failovers')
+
+    def __init__(self, size):
+        self.requests = 0
+        self.errors = 0
+        self.buckets = [0] * size
+        self.latency = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.decode_time = 0.0
+        self.retries = 0
+        self.failovers = 0
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry(Instrumentation):
+    """ Collect request metrics per RPC method and node.
+
+    For every ``(method, node)`` pair it counts requests, errors, retries
+    and failovers, sums bytes sent and received and JSON decode time, and
+    keeps a histogram of latencies.
+
+    Args:
+        buckets (tuple): Upper bounds in seconds of the latency buckets.
+        prefix (str): Prefix of the metric names in ``prometheus()``.
+
+    .. code-block:: python
+
+       from beowulfbase.metrics import MetricsRegistry
+
+       metrics = MetricsRegistry()
+       s = Beowulfd(nodes, metrics=metrics)
+       ...
+       print(metrics.prometheus())
+
+    """
+
+    def __init__(self, buckets=default_buckets, prefix='beowulf_rpc'):
+        self.bounds = tuple(sorted(buckets)) + (float('inf'),)
+        self.lateness_bounds = lateness_buckets + (float('inf'),)
+        self.prefix = prefix
+        self._series = {}
+        self._lateness = _Series(len(self.lateness_bounds))
+        self._lock = threading.Lock()
+
+    def _get(self, method, url):
+        # called with self._lock held
+        series = self._series.get((method, url))
+        if series is None:
+            series = _Series(len(self.bounds))
+            self._series[(method, url)] = series
+        return series
+
+    def on_request(self, method, url, latency, bytes_out, bytes_in,
+                   decode_time, error=None):
+        index = bisect.bisect_left(self.bounds, latency)
+        with self._lock:
+            series = self._get(method, url)
+            series.requests += 1
+            if error is not None:
+                series.errors += 1
+            series.buckets[index] += 1
+            series.latency += latency
+            series.bytes_out += bytes_out
+            series.bytes_in += bytes_in
+            series.decode_time += decode_time
+
+    def on_retry(self, method, url, next_url, error):
+        with self._lock:
+            series = self._get(method, url)
+            series.retries += 1
+            if next_url != url:
+                series.failovers += 1
+
+    def on_block(self, block_num, lateness):
+        index = bisect.bisect_left(self.lateness_bounds, lateness)
+        with self._lock:
+            self._lateness.requests += 1
+            self._lateness.buckets[index] += 1
+            self._lateness.latency += lateness
+
+    def block_lateness(self):
+        """ Return the number of blocks delivered, the sum of their
+        lateness and its cumulative histogram. """
+        with self._lock:
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.lateness_bounds,
+                                    self._lateness.buckets):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            return {'blocks': self._lateness.requests,
+                    'lateness_sum': self._lateness.latency,
+                    'lateness_buckets': buckets}
+
+    def snapshot(self):
+        """ Return a list with the metrics of every ``(method, node)``
+        pair. Histogram buckets are cumulative, keyed by upper bound. """
+        with self._lock:
+            snapshot = []
+            for (method, url), series in sorted(self._series.items()):
+                cumulative, buckets = 0, []
+                for bound, count in zip(self.bounds, series.buckets):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                snapshot.append({
+                    'method': method,
+                    'node': url,
+                    'requests': series.requests,
+                    'errors': series.errors,
+                    'retries': series.retries,
+                    'failovers': series.failovers,
+                    'latency_sum': series.latency,
+                    'latency_buckets': buckets,
+                    'bytes_out': series.bytes_out,
+                    'bytes_in': series.bytes_in,
+                    'decode_time': series.decode_time,
+                })
+            return snapshot
+
+    def prometheus(self):
+        """ Return the metrics in the Prometheus text exposition format.
+        """
+        p = self.prefix
+        counters = [
+            ('requests_total', 'requests', 'Requests sent to a node.'),
+            ('errors_total', 'errors', 'Requests which failed.'),
+            ('retries_total', 'retries', 'Failed requests retried.'),
+            ('failovers_total', 'failovers',
+             'Failed requests retried on another node.'),
+            ('request_bytes_total', 'bytes_out', 'Bytes sent.'),
+            ('response_bytes_total', 'bytes_in', 'Bytes received.'),
+            ('decode_seconds_total', 'decode_time',
+             'Seconds spent decoding JSON responses.'),
+        ]
+        snapshot = self.snapshot()
+        lines = []
+        for suffix, key, text in counters:
+            lines.append('# HELP %s_%s %s' % (p, suffix, text))
+            lines.append('# TYPE %s_%s counter' % (p, suffix))
+            for entry in snapshot:
+                lines.append('%s_%s{method="%s",node="%s"} %s' % (
+                    p, suffix, _escape(entry['method']),
+                    _escape(entry['node']), _format(entry[key])))
+
+        lines.append('# HELP %s_duration_seconds Request latency.' % p)
+        lines.append('# TYPE %s_duration_seconds histogram' % p)
+        for entry in snapshot:
+            labels = 'method="%s",node="%s"' % (_escape(entry['method']),
+                                                _escape(entry['node']))
+            for bound, count in entry['latency_buckets']:
+                lines.append('%s_duration_seconds_bucket{%s,le="%s"} %d' % (
+                    p, labels, _format(bound), count))
+            lines.append('%s_duration_seconds_sum{%s} %s' % (
+                p, labels, _format(entry['latency_sum'])))
+            lines.append('%s_duration_seconds_count{%s} %d' % (
+                p, labels, entry['requests']))
+
+        lateness = self.block_lateness()
+        if lateness['blocks']:
+            lines.append('# HELP %s_block_lateness_seconds Time from block '
+                         'production to delivery by a stream.' % p)
+            lines.append('# TYPE %s_block_lateness_seconds histogram' % p)
+            for bound, count in lateness['lateness_buckets']:
+                lines.append('%s_block_lateness_seconds_bucket{le="%s"} %d' %
+                             (p, _format(bound), count))
+            lines.append('%s_block_lateness_seconds_sum %s' % (
+                p, _format(lateness['lateness_sum'])))
+            lines.append('%s_block_lateness_seconds_count %d' % (
+                p, lateness['blocks']))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._lateness = _Series(len(self.lateness_bounds))
@@ -0,0 +1,253 @@
+# coding=utf-8
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class NodeStats(object):
+    """ Health of a single node as seen by :class:`NodePool`.
+
+    ``latency`` is an exponentially weighted moving average (EWMA) of the
+    response time in seconds, ``error_rate`` an EWMA of the failure ratio
+    which also decays with time, so that a node recovers its rank once it
+    stops failing.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.error_rate = 0.0
+        self.updated = time.time()
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def decayed_error_rate(self, now, half_life):
+        return self.error_rate * 0.5 ** ((now - self.updated) / half_life)
+
+    def as_dict(self, now, half_life):
+        return {
+            'url': self.url,
+            'latency': self.latency,
+            'error_rate': self.decayed_error_rate(now, half_life),
+            'requests': self.requests,
+            'failures': self.failures,
+            'circuit': 'open' if self.is_open else 'closed',
+        }
+
+
+class NodePool(object):
+    """ Rank nodes by latency and error rate, with a circuit breaker per
+    node.
+
+    Each node starts with a closed circuit. After ``failure_threshold``
+    consecutive failures the circuit opens and the node is not selected
+    anymore. If a ``probe`` callable is given, a background thread calls
+    ``probe(url)`` for open nodes every ``reset_timeout`` seconds and
+    closes the circuit as soon as a probe returns without raising.
+    Without a probe, an open node becomes selectable again once
+    ``reset_timeout`` has passed (half-open) and the next request decides.
+
+    Args:
+        nodes (list): Node URLs, in order of preference.
+        probe (callable): Optional health check, called as ``probe(url)``.
+        failure_threshold (int): Consecutive failures that open a circuit.
+        reset_timeout (float): Seconds before an open node is re-tested.
+        alpha (float): Weight of the newest sample in the latency and error
+            averages.
+        half_life (float): Seconds after which the error rate of a node
+            that is no longer used has halved.
+        keepalive (callable): Optional ping, called as ``keepalive(url)``
+            from a background thread for every node with a closed circuit
+            which has not been used for ``keepalive_interval`` seconds,
+            starting right away. It keeps the connections of standby
+            nodes open and their rank current; a failing ping counts as a
+            failure of the node.
+        keepalive_interval (float): Seconds between pings of an idle node.
+
+    .. code-block:: python
+
+       pool = NodePool(['https://node1', 'https://node2'])
+       url = pool.best()
+       pool.record_success(url, 0.120)
+
+    """
+
+    def __init__(self, nodes, probe=None, failure_threshold=3,
+                 reset_timeout=30, alpha=0.3, half_life=60, keepalive=None,
+                 keepalive_interval=30):
+        self.nodes = list(nodes)
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.alpha = alpha
+        self.half_life = half_life
+
+        self._stats = dict((url, NodeStats(url)) for url in self.nodes)
+        self._lock = threading.Lock()
+        self._prober = None
+        self._closed = threading.Event()
+
+        self.keepalive = keepalive
+        self.keepalive_interval = keepalive_interval
+        self._keeper = None
+        if keepalive is not None:
+            self._keeper = threading.Thread(
+                target=self._keepalive_loop, name='beowulf-node-keepalive')
+            self._keeper.daemon = True
+            self._keeper.start()
+
+    def _score(self, stats, now):
+        # untried nodes rank first, so that every node gets measured; the
+        # additive error term keeps nodes that never answered behind the
+        # healthy ones until their error rate has decayed.
+        latency = stats.latency or 0.0
+        error_rate = stats.decayed_error_rate(now, self.half_life)
+        return latency * (1 + 10 * error_rate) + error_rate
+
+    def _selectable(self, stats, now):
+        if not stats.is_open:
+            return True
+        # half-open: let a request through when there is nobody probing
+        return self.probe is None and \
+            now - stats.opened_at >= self.reset_timeout
+
+    def best(self, exclude=None):
+        """ Return the URL of the best node.
+
+        Args:
+            exclude (str): A node URL to avoid, unless it is the only one
+                left (ie: the node that has just failed).
+
+        If every circuit is open, the node whose circuit opened first is
+        returned, as it is the closest to being re-tested.
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [s for s in self._stats.values()
+                          if self._selectable(s, now)]
+            if exclude is not None and len(candidates) > 1:
+                candidates = [s for s in candidates if s.url != exclude]
+            if not candidates:
+                return min(self._stats.values(),
+                           key=lambda s: s.opened_at).url
+            return min(candidates,
+                       key=lambda s: (self._score(s, now),
+                                      self.nodes.index(s.url))).url
+
+    def is_available(self, url):
+        """ ``True`` unless the circuit of ``url`` is open. """
+        with self._lock:
+            return self._selectable(self._stats[url], time.time())
+
+    def record_success(self, url, latency):
+        """ Record a response from ``url`` that took ``latency`` seconds.
+        """
+        with self._lock:
+            stats = self._stats[url]
+            now = time.time()
+            stats.error_rate = (1 - self.alpha) * \
+                stats.decayed_error_rate(now, self.half_life)
+            stats.updated = now
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += self.alpha * (latency - stats.latency)
+            stats.requests += 1
+            stats.consecutive_failures = 0
+            if stats.is_open:
+                logger.info('Closing circuit for %s', url)
+                stats.opened_at = None
+
+    def record_failure(self, url):
+        """ Record a failed request to ``url``. """
+        with self._lock:
+            stats = self._stats[url]
+            now = time.time()
+            stats.error_rate = self.alpha + (1 - self.alpha) * \
+                stats.decayed_error_rate(now, self.half_life)
+            stats.updated = now
+            stats.requests += 1
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.is_open or \
+                    stats.consecutive_failures >= self.failure_threshold:
+                if not stats.is_open:
+                    logger.warning('Opening circuit for %s after %d '
+                                   'failures', url,
+                                   stats.consecutive_failures)
+                stats.opened_at = now
+                self._ensure_prober()
+
+    def stats(self):
+        """ Return a list with a snapshot of each node's health. """
+        now = time.time()
+        with self._lock:
+            return [self._stats[url].as_dict(now, self.half_life)
+                    for url in self.nodes]
+
+    def _ensure_prober(self):
+        # called with self._lock held
+        if self.probe is None or self._closed.is_set():
+            return
+        if self._prober is not None and self._prober.is_alive():
+            return
+        self._prober = threading.Thread(
+            target=self._probe_loop, name='beowulf-node-probe')
+        self._prober.daemon = True
+        self._prober.start()
+
+    def _probe_loop(self):
+        while not self._closed.wait(min(self.reset_timeout, 1)):
+            now = time.time()
+            with self._lock:
+                due = [s.url for s in self._stats.values() if s.is_open and
+                       now - s.opened_at >= self.reset_timeout]
+                if not any(s.is_open for s in self._stats.values()):
+                    self._prober = None
+                    return
+            for url in due:
+                start = time.time()
+                try:
+                    self.probe(url)
+                except Exception as e:
+                    logger.debug('Probe of %s failed -- %s: %s', url,
+                                 e.__class__.__name__, e)
+                    with self._lock:
+                        self._stats[url].opened_at = time.time()
+                else:
+                    self.record_success(url, time.time() - start)
+
+    def _keepalive_loop(self):
+        # nodes which were never used are pinged right away, which opens
+        # their first connection
+        wait = 0
+        while not self._closed.wait(wait):
+            now = time.time()
+            with self._lock:
+                due = [s.url for s in self._stats.values()
+                       if not s.is_open and (
+                           not s.requests or
+                           now - s.updated >= self.keepalive_interval)]
+            for url in due:
+                start = time.time()
+                try:
+                    self.keepalive(url)
+                except Exception as e:
+                    logger.info('Keepalive ping of %s failed -- %s: %s',
+                                url, e.__class__.__name__, e)
+                    self.record_failure(url)
+                else:
+                    self.record_success(url, time.time() - start)
+            wait = min(self.keepalive_interval, 1)
+
+    def close(self):
+        """ Stop the background threads. """
+        self._closed.set()
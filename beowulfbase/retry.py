@@ -0,0 +1,70 @@
+# coding=utf-8
+import random
+import threading
+import time
+
+
+def backoff_delay(tries, base=0.5, cap=10):
+    """ Seconds to wait before retry number ``tries``, using exponential
+    backoff with full jitter.
+
+    The delay is drawn uniformly between 0 and ``base * 2 ** (tries - 1)``,
+    capped at ``cap``, so that clients failing at the same time do not
+    retry in lockstep.
+
+    Args:
+        tries (int): Number of the upcoming retry, starting at 1.
+        base (float): Upper bound of the first delay.
+        cap (float): Upper bound of any delay.
+    """
+    return random.uniform(0, min(cap, base * 2 ** max(tries - 1, 0)))
+
+
+class RetryBudget(object):
+    """ Token bucket limiting the retries of a client.
+
+    Every retry takes a token. The bucket holds at most ``capacity``
+    tokens and is refilled at ``refill_rate`` tokens per second. While it
+    is empty, calls fail instead of retrying, so that a partial outage
+    does not multiply the load on the nodes that are still up.
+
+    Args:
+        capacity (float): Size of the bucket, i.e. the burst of retries
+            allowed after a quiet period.
+        refill_rate (float): Tokens added per second.
+
+    .. code-block:: python
+
+       budget = RetryBudget(capacity=20, refill_rate=2)
+       if budget.acquire():
+           retry()
+
+    """
+
+    def __init__(self, capacity=20, refill_rate=2):
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # called with self._lock held
+        self._tokens = min(self.capacity, self._tokens +
+                           (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def acquire(self):
+        """ Take a token. Returns ``False`` if the budget is spent. """
+        with self._lock:
+            self._refill(time.time())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill(time.time())
+            return self._tokens
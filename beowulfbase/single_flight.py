@@ -0,0 +1,98 @@
+# coding=utf-8
+import concurrent.futures
+import threading
+import time
+
+
+class WaitTimeout(concurrent.futures.TimeoutError):
+    """ A shared call did not finish within the waiter's timeout. """
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error', 'finished')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+
+class SingleFlight(object):
+    """ Coalesce concurrent calls that share a key into one execution.
+
+    While a call for a key is running, other threads calling ``do`` with
+    the same key wait for it and get its result (or its exception)
+    instead of running their own. With ``fresh_for`` greater than zero, a
+    successful result is also handed out to calls made up to
+    ``fresh_for`` seconds after it finished.
+
+    Args:
+        fresh_for (float): Seconds a finished result may be reused.
+
+    .. code-block:: python
+
+       flight = SingleFlight()
+       props = flight.do('props', rpc.call, 'get_dynamic_global_properties')
+
+    """
+
+    # sweep expired results once this many keys are remembered
+    sweep_size = 1024
+
+    def __init__(self, fresh_for=0):
+        self.fresh_for = fresh_for
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _is_fresh(self, call, now):
+        return call.error is None and now - call.finished < self.fresh_for
+
+    def _sweep(self, now):
+        # called with self._lock held
+        for key, call in list(self._calls.items()):
+            if call.done.is_set() and not self._is_fresh(call, now):
+                del self._calls[key]
+
+    def do(self, key, fn, *args, **kwargs):
+        """ Run ``fn(*args, **kwargs)`` unless a call with ``key`` is in
+        flight or fresh, in which case its outcome is shared. """
+        return self.do_within(None, key, fn, *args, **kwargs)
+
+    def do_within(self, timeout, key, fn, *args, **kwargs):
+        """ Like ``do``, but wait at most ``timeout`` seconds for a call
+        in flight, then raise ``WaitTimeout``. The
+        call itself goes on for the other waiters. """
+        now = time.time()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and (not call.done.is_set() or
+                                     self._is_fresh(call, now)):
+                leader = False
+            else:
+                if len(self._calls) >= self.sweep_size:
+                    self._sweep(now)
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise WaitTimeout('Timed out waiting for %r' % (key,))
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished = time.time()
+            with self._lock:
+                if (not self.fresh_for or call.error is not None) and \
+                        self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,259 @@
+# coding=utf-8
+import ipaddress
+import socket
+import ssl
+import sys
+import threading
+import weakref
+
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+if sys.version >= '3.0':
+    from urllib.parse import urlparse, unquote
+else:
+    from urlparse import urlparse
+    from urllib import unquote
+
+#: node URL schemes served over a Unix domain socket
+unix_schemes = ('http+unix', 'unix')
+
+#: host names which are always served by a ``LocalTransport``
+local_hosts = frozenset(['localhost', 'localhost.localdomain'])
+
+
+def parse_unix_url(url):
+    """ Split a Unix socket node URL into the socket path and the HTTP
+    path to post to.
+
+    Two forms are accepted: ``http+unix://%2Frun%2Fbeowulfd.sock/rpc``,
+    with the socket path percent-encoded as host, and
+    ``unix:///run/beowulfd.sock``, where the whole path is the socket.
+
+    Returns:
+        tuple: ``(socket_path, http_path)``.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return unquote(parsed.path), '/'
+    return unquote(parsed.netloc), parsed.path or '/'
+
+
+def is_local(url):
+    """ ``True`` if ``url`` is a plain HTTP URL of this host. """
+    parsed = urlparse(url)
+    if parsed.scheme != 'http':
+        return False
+    if parsed.hostname in local_hosts:
+        return True
+    try:
+        return ipaddress.ip_address(parsed.hostname).is_loopback
+    except ValueError:
+        return False
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """ urllib3 connection over a Unix domain socket. """
+
+    def __init__(self, *args, **kwargs):
+        self.socket_path = kwargs.pop('socket_path')
+        kwargs.pop('socket_options', None)
+        super(UnixHTTPConnection, self).__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    """ urllib3 keep-alive connection pool to a Unix domain socket.
+
+    Responses, timeouts, retries and errors are urllib3's own, so the
+    pool is a drop-in replacement for a TCP pool.
+    """
+    ConnectionCls = UnixHTTPConnection
+
+    def __init__(self, socket_path, **kwargs):
+        super(UnixHTTPConnectionPool, self).__init__(
+            'localhost', socket_path=socket_path, **kwargs)
+        self.socket_path = socket_path
+
+    def __str__(self):
+        return '%s(socket_path=%r)' % (type(self).__name__, self.socket_path)
+
+
+class _SessionSocket(ssl.SSLSocket):
+    """ SSL socket which hands its TLS session over to its context when
+    it is closed, so that the session outlives the connection. """
+
+    def close(self):
+        if isinstance(self.context, TLSSessionContext):
+            self.context._save_session(self)
+        super(_SessionSocket, self).close()
+
+
+class TLSSessionContext(ssl.SSLContext):
+    """ SSL context which resumes the TLS session of the previous
+    connection to the same host.
+
+    A resumed handshake skips the certificate exchange and verification,
+    so a new connection to a node costs one round trip less. The session
+    of each host is kept when a connection is opened and when it is
+    closed, and taken from the newest live connection when there is one,
+    as TLS 1.3 servers only send session tickets after the handshake. So
+    a reconnect after all connections to a node were closed (a failover,
+    a dropped keep-alive) still resumes.
+
+    Settings match urllib3's defaults (TLS 1.2 or newer, certificate and
+    hostname verification, no compression), except that session tickets
+    are allowed.
+
+    Args:
+        ca_certs (str): CA bundle to verify nodes with. Defaults to the
+            system certificates.
+
+    .. code-block:: python
+
+       http = urllib3.PoolManager(ssl_context=TLSSessionContext(
+           certifi.where()))
+
+    """
+    sslsocket_class = _SessionSocket
+
+    def __new__(cls, ca_certs=None):
+        return super(TLSSessionContext, cls).__new__(
+            cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self, ca_certs=None):
+        self.minimum_version = ssl.TLSVersion.TLSv1_2
+        self.options |= ssl.OP_NO_COMPRESSION
+        self.verify_mode = ssl.CERT_REQUIRED
+        self.check_hostname = True
+        if ca_certs:
+            self.load_verify_locations(ca_certs)
+        else:
+            self.load_default_certs()
+        self._sessions = {}
+        self._sockets = {}
+        self._sessions_lock = threading.Lock()
+
+    def _save_session(self, sock):
+        """ Keep the session of ``sock`` as the one to resume, unless it
+        has no ticket and the kept one has. """
+        try:
+            session = sock.session
+        except (OSError, ValueError):
+            return
+        if session is None:
+            return
+        with self._sessions_lock:
+            kept = self._sessions.get(sock.server_hostname)
+            if kept is None or session.has_ticket or not kept.has_ticket:
+                self._sessions[sock.server_hostname] = session
+
+    def _session(self, host):
+        """ Newest resumable session of ``host``, or ``None``. """
+        with self._sessions_lock:
+            last_socket = self._sockets.get(host)
+        sock = last_socket() if last_socket is not None else None
+        if sock is not None:
+            # it may have received a ticket since its handshake
+            self._save_session(sock)
+        with self._sessions_lock:
+            return self._sessions.get(host)
+
+    def wrap_socket(self, sock, server_side=False,
+                    do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if server_side:
+            return super(TLSSessionContext, self).wrap_socket(
+                sock, server_side, do_handshake_on_connect,
+                suppress_ragged_eofs, server_hostname, session)
+        if session is None:
+            session = self._session(server_hostname)
+        ssl_sock = super(TLSSessionContext, self).wrap_socket(
+            sock, server_side, do_handshake_on_connect,
+            suppress_ragged_eofs, server_hostname, session)
+        self._save_session(ssl_sock)
+        with self._sessions_lock:
+            self._sockets[server_hostname] = weakref.ref(ssl_sock)
+        return ssl_sock
+
+
+class PoolTransport(object):
+    """ Transport sending every request to a single connection pool.
+
+    Unlike ``urllib3.PoolManager``, it does not parse the URL nor look up
+    the pool of each request, and it does not need a TLS setup.
+
+    Args:
+        pool (HTTPConnectionPool): The pool of the node.
+        path (str): HTTP path of the JSON-RPC endpoint.
+    """
+
+    def __init__(self, pool, path='/'):
+        self.pool = pool
+        self.path = path
+
+    def urlopen(self, method, url, **kwargs):
+        return self.pool.urlopen(method, self.path, **kwargs)
+
+    def clear(self):
+        self.pool.close()
+
+
+def unix_transport(url, **pool_kwargs):
+    """ Transport for ``http+unix://`` and ``unix://`` node URLs. """
+    socket_path, path = parse_unix_url(url)
+    return PoolTransport(UnixHTTPConnectionPool(socket_path, **pool_kwargs),
+                         path)
+
+
+def local_transport(url, **pool_kwargs):
+    """ Keep-alive HTTP/1.1 transport for ``http://`` nodes on this host.
+    """
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    pool = HTTPConnectionPool(parsed.hostname, parsed.port or 80,
+                              **pool_kwargs)
+    return PoolTransport(pool, path)
+
+
+#: transport factories by node URL scheme, called as
+#: ``factory(url, **pool_kwargs)``. Schemes not listed here (``http`` to
+#: remote hosts and ``https``) go through the client's ``PoolManager``.
+transports = {
+    'http+unix': unix_transport,
+    'unix': unix_transport,
+}
+
+
+def get_transport(url, pool_manager, **pool_kwargs):
+    """ Return the transport for node ``url``.
+
+    Args:
+        url (str): Node URL.
+        pool_manager (urllib3.PoolManager): Transport for URLs without a
+            dedicated one.
+        pool_kwargs: Settings of new connection pools (``maxsize``,
+            ``timeout``, ``retries``, ...).
+
+    Returns:
+        An object with the ``urlopen(method, url, **kwargs)`` and
+        ``clear()`` methods of ``urllib3.PoolManager``.
+    """
+    factory = transports.get(urlparse(url).scheme)
+    if factory is None and is_local(url):
+        factory = local_transport
+    if factory is None:
+        return pool_manager
+    return factory(url, **pool_kwargs)
@@ -0,0 +1,47 @@
+""" Fill a local block archive from beowulfd nodes.
+
+Fetches the irreversible blocks in the given range, and their operations,
+that the archive does not have yet (see beowulf.archive).
+
+    python scripts/backfill_archive.py --start 1 /data/bwf-archive
+    python scripts/backfill_archive.py --nodes https://node.example \\
+        --start 1000000 --end 2000000 /data/bwf-archive
+"""
+import argparse
+import logging
+import time
+
+from beowulf.archive import BlockArchive, backfill
+from beowulf.beowulfd import Beowulfd
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path', help='archive directory')
+    parser.add_argument('--nodes', nargs='+',
+                        help='nodes to fetch from, defaults to the '
+                             'configured ones')
+    parser.add_argument('--start', type=int, default=1)
+    parser.add_argument('--end', type=int,
+                        help='last block, defaults to the last '
+                             'irreversible one')
+    parser.add_argument('--max-in-flight', type=int)
+    parser.add_argument('--compress-level', type=int, default=6)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    beowulfd = Beowulfd(args.nodes, cache=False)
+    archive = BlockArchive(args.path, compress_level=args.compress_level,
+                           chain_id=beowulfd.chain_params['chain_id'])
+    began = time.time()
+    try:
+        added = backfill(beowulfd, archive, args.start, args.end,
+                         max_in_flight=args.max_in_flight)
+    finally:
+        archive.close()
+        beowulfd.close()
+    print('%d records added in %.0f seconds' % (added, time.time() - began))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+""" Compare the JSON codecs of beowulfbase.json_codec on real block payloads.
+
+Raw `get_block` responses are fetched from a node, or read from a file
+written by an earlier run with ``--save``, and then decoded and encoded
+with every installed codec.
+
+    python scripts/bench_json_codec.py --node https://bw.beowulfchain.com \
+        --start 1000000 --count 200 --save blocks.jsonl
+    python scripts/bench_json_codec.py --file blocks.jsonl
+"""
+import argparse
+import sys
+import time
+
+import urllib3
+from prettytable import PrettyTable
+
+from beowulfbase.json_codec import JsonCodec, codecs
+
+
+def fetch_payloads(node, start, count):
+    http = urllib3.PoolManager(headers={'Content-Type': 'application/json'})
+    codec = JsonCodec()
+    payloads = []
+    for block_num in range(start, start + count):
+        body = codec.encode_request(
+            'get_block', [block_num], 'condenser_api', block_num)
+        response = http.urlopen('POST', node, body=body)
+        payloads.append(response.data)
+    return payloads
+
+
+def bench(codec, payloads, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = [codec.loads(payload) for payload in payloads]
+    loads = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for obj in decoded:
+            codec.dumps(obj)
+    dumps = time.perf_counter() - start
+    return loads, dumps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--node', help='beowulfd node to fetch blocks from')
+    parser.add_argument('--start', type=int, default=1)
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--file', help='read raw responses from this file')
+    parser.add_argument('--save', help='write raw responses to this file')
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'rb') as f:
+            payloads = [line.rstrip(b'\n') for line in f if line.strip()]
+    elif args.node:
+        payloads = fetch_payloads(args.node, args.start, args.count)
+    else:
+        parser.error('either --node or --file is required')
+
+    if args.save:
+        with open(args.save, 'wb') as f:
+            for payload in payloads:
+                f.write(payload.replace(b'\n', b'') + b'\n')
+
+    size = sum(len(payload) for payload in payloads)
+    print('%d responses, %.1f KiB on average' %
+          (len(payloads), size / len(payloads) / 1024.0))
+
+    table = PrettyTable(['codec', 'loads MB/s', 'dumps MB/s'])
+    table.align = 'r'
+    for name, cls in sorted(codecs.items()):
+        try:
+            codec = cls()
+        except ImportError:
+            print('%s is not installed, skipped' % name, file=sys.stderr)
+            continue
+        loads, dumps = bench(codec, payloads, args.rounds)
+        megabytes = size * args.rounds / 1e6
+        table.add_row([name, '%.1f' % (megabytes / loads),
+                       '%.1f' % (megabytes / dumps)])
+    print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+""" Benchmark the client stack against local fake beowulfd nodes.
+
+Starts one healthy and, with ``--faulty``, one misbehaving
+beowulf.fake_beowulfd node in process, then measures fetching blocks in
+bulk, single calls, streaming operations and signing and broadcasting
+transfers with Commit.
+
+    python scripts/bench_rpc.py --blocks 5000 --latency 0.01
+    python scripts/bench_rpc.py --faulty --error-rate 0.2
+"""
+import argparse
+import time
+from functools import partial
+
+from prettytable import PrettyTable
+
+from beowulf.beowulfd import Beowulfd
+from beowulf.blockchain import Blockchain
+from beowulf.commit import Commit
+from beowulf.fake_beowulfd import FakeBeowulfd
+from beowulfbase.metrics import MetricsRegistry
+
+
+def bench_stream_blocks(beowulfd, start, count):
+    blocks = list(beowulfd.stream_blocks(range(start, start + count)))
+    return len(blocks)
+
+
+def bench_get_block(beowulfd, start, count):
+    for block_num in range(start, start + count):
+        beowulfd.get_block(block_num)
+    return count
+
+
+def bench_stream_from(beowulfd, start, count):
+    blockchain = Blockchain(beowulfd, mode='head')
+    ops = blockchain.stream_from(start_block=start,
+                                 end_block=start + count - 1)
+    return sum(1 for _ in ops)
+
+
+def bench_commit_transfer(beowulfd, chain, count):
+    sender, recipient = chain.account_name(1), chain.account_name(2)
+    commit = Commit(beowulfd_instance=beowulfd,
+                    keys=[chain.private_key(sender)])
+    for i in range(count):
+        # distinct memos, so that no two transactions are identical
+        commit.transfer(recipient, 1.0, 'BWF', account=sender, memo=str(i))
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--blocks', type=int, default=2000)
+    parser.add_argument('--transfers', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--faulty', action='store_true',
+                        help='add a second node which injects errors')
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    nodes = [FakeBeowulfd(latency=args.latency, seed=args.seed).start()]
+    if args.faulty:
+        nodes.insert(0, FakeBeowulfd(
+            latency=args.latency, seed=args.seed,
+            error_rate=args.error_rate,
+            disconnect_rate=args.error_rate / 2).start())
+
+    metrics = MetricsRegistry()
+    beowulfd = Beowulfd([node.url for node in nodes], cache=False,
+                        metrics=metrics)
+    start = beowulfd.head_block_number - args.blocks
+
+    table = PrettyTable(['benchmark', 'items', 'seconds', 'items/s'])
+    table.align = 'r'
+    benchmarks = [
+        ('stream_blocks',
+         partial(bench_stream_blocks, beowulfd, start, args.blocks)),
+        ('get_block', partial(bench_get_block, beowulfd, start, args.blocks)),
+        ('stream_from',
+         partial(bench_stream_from, beowulfd, start, args.blocks)),
+        ('Commit.transfer', partial(bench_commit_transfer, beowulfd,
+                                    nodes[-1].chain, args.transfers)),
+    ]
+    for name, bench in benchmarks:
+        began = time.perf_counter()
+        items = bench()
+        elapsed = time.perf_counter() - began
+        table.add_row([name, items, '%.2f' % elapsed,
+                       '%.0f' % (items / elapsed)])
+    print(table)
+
+    table = PrettyTable(['node', 'method', 'requests', 'errors', 'retries',
+                         'failovers', 'mean ms'])
+    table.align = 'r'
+    for entry in metrics.snapshot():
+        table.add_row([entry['node'], entry['method'], entry['requests'],
+                       entry['errors'], entry['retries'], entry['failovers'],
+                       '%.1f' % (1000 * entry['latency_sum'] /
+                                 max(entry['requests'], 1))])
+    print(table)
+
+    beowulfd.close()
+    for node in nodes:
+        node.stop()
+
+
+if __name__ == '__main__':
+    main()
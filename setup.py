@@ -152,6 +152,8 @@ setup(
     extras_require={
         'dev': TEST_REQUIRED + BUILD_REQUIRED,
         'build': BUILD_REQUIRED,
+        'fast': ['orjson'],
+        'stream': ['ijson>=3.1'],
         'test': TEST_REQUIRED
     },
     tests_require=TEST_REQUIRED,